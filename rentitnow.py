@@ -0,0 +1,2959 @@
+# coding: utf-8
+
+# ## RentItNow car sharing
+# 
+# You are software engineer at **RentItNow**, a car sharing company located in SimpleTown.
+# SimpleTown is a rounded village dived in three concentric circles: **Inner Circle**, **Middle Circle**, **Outer Circle**.
+# 
+# Your boss asks you to develop a new software to manage company's cars and users.
+# The boss needs to:
+# - Add, update and remove cars;
+# - Check the status of the car: location, total distance traveled, next service time, availability.
+# - Add, update and remove users;
+# 
+# A car has (at least)
+# - a type, 
+# - a license plate, 
+# - a brand,
+# - a name
+# 
+# There are three types of car: 
+# - **ECO**, max 2 persons,
+# - **MID-CLASS**, max 4 persons,
+# - **DELUXE**, max 7 persons.
+# 
+# Each type of car has a rental price per km:
+# - **ECO**: 1$/km;
+# - **MID-CLASS**: 2$/km;
+# - **DELUXE**: 5$/km
+# 
+# Each type of car has a fixed speed:
+# - **ECO**: 15km/h
+# - **MID-CLASS**: 25km/h
+# - **DELUXE**: 50km/h
+# 
+# The company must **service** its cars every 1500km. Service takes 1 day and cost 300$. Car cannot be rented on that day.
+# 
+# A **user** can register to the company service, update its data and delete its account. User has (at least):
+# - name, 
+# - surname, 
+# - address, 
+# - credit card,
+# - driving license
+# 
+# A user can ask for a car: select type of car, number of passengers, starting circle and destination circle. 
+# 
+# Travel distance is computed based on **hops**; an hop is 5km; an hops is going from one circle to the next one. **Always counts 1 hop for the starting circle**
+# (e.g. travelling from Inner Circle to Middle Circle is 2 hops, not 1 hop). Travelling in the same circle is 1 hop.
+# 
+# The software select the best car for the user based on some metric (up to you), calculate the cost of the trip and make the payment.
+# If no car is available, the software presents the user an expected waiting time. 
+# 
+# This module has the classes of **RentItNow** and its tools; importing it doesn't run anything. The scenarios that use them (the examples, benchmarks and simulations) are in **scenarios.py**, which also runs them from the command line.
+
+
+import array
+import asyncio
+import bisect
+import contextlib
+import csv
+import functools
+import gc
+import heapq
+import http.server
+import io
+import itertools
+import json
+import multiprocessing
+import operator
+import os
+import platform
+import queue
+import random
+import sqlite3
+import threading
+import time
+import tracemalloc
+import weakref
+import zlib
+from collections import deque, namedtuple
+from decimal import Decimal
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# **Circle** class used to calculated the distance in kilometers between hops
+# 
+# There is only one **Circle** object per circle name: calling **Circle(name)** again returns the same object, which has a small integer **id**. The distances between circles are computed once in the **DISTANCES** table, so **distance_to** is a single lookup in the table.
+# 
+# The town is set with **Circle.configure**: any number of circles or zones (**names**), the **hop_length** in km and the **hops** between every pair of them. Without **hops** the circles are concentric rings in the order of **names**, and the hops are computed as 1 for the starting circle plus 1 for every ring crossed (**ring_hops**). The default is the three circles of SimpleTown. Every circle also keeps all the circles sorted by the km needed to pick a user up in it (**pickup_order**), so the dispatch visits the nearest circles first. The town must be configured before creating **RentItNow**, which builds its tables from the circles.
+
+class Circle:
+    DEFAULT_NAMES = ["Inner Circle", "Middle Circle", "Outer Circle"]
+
+    def __new__(cls, name):
+        circle = cls.instances.get(name)
+        if circle is None:
+            circle_id = cls.IDS.get(name)
+            if circle_id is None:
+                raise ValueError(f"Invalid circle: {name}")
+            circle = super().__new__(cls)
+            circle.name = name
+            circle.id = circle_id
+            cls.instances[name] = circle
+        return circle
+
+    def distance_to(self, other_circle):
+        return self.DISTANCES[self.id][other_circle.id]
+
+    @staticmethod
+    def ring_hops(num_circles):
+        # Hops between concentric rings, always counting 1 hop for the starting circle
+        return [[abs(i - j) + 1 for j in range(num_circles)] for i in range(num_circles)]
+
+    @classmethod
+    def configure(cls, names=None, hop_length=5, hops=None):
+        names = list(names) if names is not None else list(cls.DEFAULT_NAMES)
+        if len(set(names)) != len(names):
+            raise ValueError("Duplicate circle names")
+        if hops is None:
+            hops = cls.ring_hops(len(names))
+        elif len(hops) != len(names) or any(len(row) != len(names) for row in hops):
+            raise ValueError(f"The hops must be a {len(names)}x{len(names)} matrix")
+
+        cls.NAMES = names
+        cls.IDS = {name: circle_id for circle_id, name in enumerate(names)}
+        cls.HOP_LENGTH = hop_length
+        # Hops between circles indexed by circle id
+        cls.HOPS = [list(row) for row in hops]
+        cls.DISTANCES = [[hops * hop_length for hops in row] for row in cls.HOPS]
+        cls.instances = {}
+        circles = [cls(name) for name in names]
+        for start_circle in circles:
+            start_circle.pickup_order = [(pickup_distance, circle) for pickup_distance, _, circle in
+                                         sorted((circle.distance_to(start_circle) - circle.distance_to(circle), circle.id, circle)
+                                                for circle in circles)]
+
+
+Circle.configure()
+
+
+# **Metrics** collects counters and latency histograms of the hot paths: reservations and misses of **User.reserve_car** and **reserve_batch**, the cars scanned by **find_best_car**, the services of the cars and the updates of the ledger. It is off by default: **RentItNow.metrics** is None and every instrumented method only checks that, so the cost is one attribute read. **RentItNow.enable_metrics** switches it on.
+# 
+# The counters and histograms can have labels (e.g. the car type). **to_prometheus** returns a snapshot in the Prometheus text format and **to_json** a dictionary, **write** dumps one of them to a file and **serve** answers them over HTTP on a local port, so they can be scraped.
+
+class Metrics:
+    # Upper bounds in seconds of the buckets of the latency histograms
+    BUCKETS = [0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.01, 0.1, 1.0]
+
+    def __init__(self):
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [count per bucket, plus the ones above the last bucket], sum, count
+        self.lock = threading.Lock()
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(self.BUCKETS) + 1), 0.0, 0]
+            histogram[0][bisect.bisect_left(self.BUCKETS, seconds)] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def get_counter(self, name, **labels):
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    @staticmethod
+    def format_labels(labels, extra=()):
+        labels = list(labels) + list(extra)
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+    def to_prometheus(self):
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, [list(histogram[0]), histogram[1], histogram[2]]) for key, histogram in self.histograms.items())
+
+        lines = []
+        last_name = None
+        for (name, labels), value in counters:
+            if name != last_name:
+                lines.append(f"# TYPE rentitnow_{name} counter")
+                last_name = name
+            lines.append(f"rentitnow_{name}{self.format_labels(labels)} {value}")
+        for (name, labels), (buckets, total, count) in histograms:
+            if name != last_name:
+                lines.append(f"# TYPE rentitnow_{name} histogram")
+                last_name = name
+            cumulative = 0
+            for bound, bucket_count in zip(self.BUCKETS + ["+Inf"], buckets):
+                cumulative += bucket_count
+                lines.append(f"rentitnow_{name}_bucket{self.format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"rentitnow_{name}_sum{self.format_labels(labels)} {total}")
+            lines.append(f"rentitnow_{name}_count{self.format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        with self.lock:
+            return {
+                "counters": [{"name": name, "labels": dict(labels), "value": value}
+                             for (name, labels), value in self.counters.items()],
+                "histograms": [{"name": name, "labels": dict(labels), "buckets": dict(zip(map(str, self.BUCKETS + ["+Inf"]), histogram[0])),
+                                "sum": histogram[1], "count": histogram[2]}
+                               for (name, labels), histogram in self.histograms.items()],
+            }
+
+    def write(self, path, format="prometheus"):
+        with open(path, "w") as file:
+            if format == "json":
+                json.dump(self.to_json(), file, indent=2)
+            else:
+                file.write(self.to_prometheus())
+
+    def serve(self, host="127.0.0.1", port=9464):
+        # /metrics answers the Prometheus text, /metrics.json the JSON; the server runs in a daemon thread
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics.json":
+                    body, content_type = json.dumps(metrics.to_json()).encode(), "application/json"
+                elif self.path == "/metrics":
+                    body, content_type = metrics.to_prometheus().encode(), "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+# **RentItNow** class where the users and cars are stored. All the methods to add, update and delete cars and users are here.
+# 
+# I also added a variable bank account to store the payments done by the users for their trip.
+# 
+# The method **reserve_batch** handles many trip requests at once, each one a tuple (user, car type, number of passengers, starting circle, destination circle). The requests are grouped by car type, each request gets the best available car or the expected waiting time, and the payments of the whole batch are added to the bank account with one **update_bank_account_batch** call.
+# 
+# The method **find_best_car** returns the best available car of the type chosen by the user without scanning the fleet: the available cars are kept in heaps per car type (**available_cars**), ordered by the position in which the car was added. The cost per km is the same for every car of a type, so the car added first is as cheap as any other. The heaps are updated by **add_car**, **update_car**, **remove_car** and by the **reserve**, **make_available** and **service** methods of the **Car** class; cars that are no longer available are dropped lazily when they reach the top of the heap.
+# 
+# Cars and users are stored in dictionaries keyed by license plate and driving license, so lookup, update and delete don't need to scan the whole list. Python dictionaries keep the insertion order, so **iterate_cars**, **iterate_users** and **get_last_saved_car_by_type** see the cars and users in the order they were added. **add_cars** and **remove_cars** add or remove many cars at once.
+# 
+# When a car is rented, **rent_car** records when it will be available again (**release_time**, in hours of **current_time**): the end of the trip, plus one day if the car goes to service after the trip. The release times are kept in a heap per car type, so **expected_waiting_time** returns the time until the first rented car of that type is released without scanning the fleet. If there are no rented cars of that type it returns None.
+# 
+# Every car knows the circle where it is (**Car.circle**, None for a car never rented whose location is unknown), and at the end of a trip it stays in the destination circle. The heaps of the available cars are kept per car type and per circle, so **find_best_car** looks only at the top car of the circles, from the nearest to the starting circle of the user (**Circle.pickup_order**), and stops at the first distance with a car: it picks the car with the shortest way to the user (**get_pickup_distance**), then the one added first. The km driven to pick the user up count for the service of the car like the km of the trip. Cars with an unknown location are considered already in the starting circle.
+# 
+# A car carries at most **Car.TYPE_CAPACITIES** passengers, so a request for a group larger than the requested type is refused, with or without upgrades (**get_matching_types**). With **allow_upgrades** a request falls back to the next larger class when no car of the requested type is free, at the price of the requested type. The heaps are already split by car type, so trying the next class is one more look at the top of its heaps. The locks of the matching types are always taken from the smallest class to the largest, so two reservations never wait for each other.
+# 
+# The status of the fleet is kept in counters per car type (**fleet_counters**: cars, available, in service, serviced at least once, km driven), updated by **add_car**, **update_car**, **remove_car** and by the **reserve**, **make_available**, **service**, **move_to** and **set_total_distance** methods of the **Car** class. Every car keeps the values it was last counted with (**counted_state** and **counted_distance**), so **recount_car** and **recount_distance** move it from those to its current values, and **update_car** on the same object, after its attributes were changed directly, removes the old values instead of the new ones. **fleet_summary** reads them with the revenue of the ledger, so a dashboard can poll it every second whatever the size of the fleet. **check_fleet_counters** counts everything again from **iterate_cars** and returns the counters that don't match, to check them in the tests.
+# 
+# With **max_pickup_distance** (in km, None means no limit) a car is only sent to users close enough, and **reposition_car** moves an available car to another circle without a user, counting the km for its service. Both are used by the **FleetRebalancer**; **record_request** passes every trip request to its **DemandStats** when one is set in **demand_stats**.
+# 
+# The cost and the travel time of a trip come from the tables of the **PricingEngine** (**pricing**), so **rent_car** makes one lookup per rental. **enable_surge_pricing** raises the prices of the circles where the requests of a car type outnumber its available cars: the available cars per car type and circle are counted with the fleet counters (**available_by_circle**), and **update_surge** compares them with the requests of **demand_stats** every **surge_interval** hours, when **advance_time** is called.
+# 
+# **RentItNow** can serve reservations from many threads at the same time. **User.reserve_car** uses **reserve_best_car**, which finds and rents the car while holding the lock of the car type, so two threads never get the same car and requests for different car types don't wait for each other. The payments are recorded in the **Ledger**, in a shard of the thread, so no payment is lost and the threads don't share a lock for them.
+# 
+# The lock of a car type is taken once, by the public entry points: **reserve_best_car**, **reserve_batch**, **add_car**, **update_car**, **remove_car**, **reposition_car**, **take_car_in_circle**, **expected_waiting_time**, **Car.make_available** and **Car.service**. The helpers they call (**find_best_car**, **rent_car**, **take_best_car**, **set_release_time**, **update_fleet_counters**, **recount_car**, **recount_distance**) don't take it again, so they are called under the lock or by a single thread, like the recovery of the **Journal**. **FleetSimulator** reserves through **reserve_best_car** too.
+
+def journaled(encode):
+    # Records the call in the journal before running it; calls made by another journaled call are not recorded,
+    # because replaying the outer call repeats them
+    def decorator(method):
+        operation = method.__name__
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            journal = self.journal
+            if journal is None or getattr(journal.local, "depth", 0):
+                return method(self, *args, **kwargs)
+            journal.append(operation, encode(self, *args, **kwargs))
+            journal.local.depth = 1
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                journal.local.depth = 0
+        return wrapper
+    return decorator
+
+
+class RentItNow:
+    SERVICE_DURATION = 24  # hours
+    FLEET_COUNTERS = ["cars", "available", "in_service", "serviced", "distance"]
+
+    def __init__(self, allow_upgrades=False, max_pickup_distance=None):
+        self.cars = {}
+        self.available_cars = {}
+        self.next_car_position = 0
+        self.heap_counter = itertools.count()
+        self.release_times = {}
+        self.users = {}
+        self.circles = {name: Circle(name) for name in Circle.NAMES}
+        self.ledger = Ledger()
+        self.type_locks = {}
+        self.registry_lock = threading.RLock()
+        self.current_time = 0  # simulated hours since the start, advanced by FleetSimulator
+        self.maintenance = MaintenanceScheduler(self)
+        self.journal = None
+        self.metrics = None
+        self.allow_upgrades = allow_upgrades
+        self.matching_types = {}  # (car type, number of passengers) -> car types that can serve the request
+        self.fleet_counters = {}  # car type -> {counter name: value}
+        self.counted_states = {}  # (car type, availability, in_service, serviced, circle) -> the same tuple, shared by the cars
+        self.max_pickup_distance = max_pickup_distance
+        self.demand_stats = None
+        self.available_by_circle = {}  # (car type, circle) -> available cars, the circle is None for an unknown location
+        self.pricing = PricingEngine(self.circles.values())
+        self.surge_interval = None  # hours, None when surge pricing is off
+        self.next_surge_update = None
+
+    def enable_metrics(self, metrics=None):
+        self.metrics = metrics if metrics is not None else Metrics()
+        return self.metrics
+
+    def disable_metrics(self):
+        self.metrics = None
+        
+    def iterate_cars(self):
+        for car in self.cars.values():
+            yield car
+
+    def get_car(self, license_plate):
+        return self.cars.get(license_plate)
+            
+    def get_last_saved_car_by_type(self, car_type: str):
+        last_saved_car = None
+        for car in reversed(self.cars.values()):
+            if car.type == car_type:
+                last_saved_car = car
+                break
+        return last_saved_car
+    
+    def get_type_lock(self, car_type: str):
+        lock = self.type_locks.get(car_type)
+        if lock is None:
+            lock = self.type_locks.setdefault(car_type, threading.RLock())
+        return lock
+
+    @journaled(lambda self, car: [Journal.car_to_record(car)])
+    def add_car(self, car):
+        with self.registry_lock:
+            if car.license_plate in self.cars:
+                self.update_car(car)
+                return
+            self.cars[car.license_plate] = car
+            car.rent_it_now = self
+            car.position = self.next_car_position
+            self.next_car_position += 1
+        with self.get_type_lock(car.type):
+            self.count_car(car)
+            self.car_availability_changed(car)
+            self.car_distance_changed(car)
+
+    def add_cars(self, cars):
+        # With a journal every car is recorded by add_car, otherwise the new cars of each type are indexed in one go
+        if self.journal is not None:
+            for car in cars:
+                self.add_car(car)
+            return
+
+        new_cars_by_type = {}
+        existing_cars = []
+        with self.registry_lock:
+            for car in cars:
+                if car.license_plate in self.cars:
+                    existing_cars.append(car)
+                    continue
+                self.cars[car.license_plate] = car
+                car.rent_it_now = self
+                car.position = self.next_car_position
+                self.next_car_position += 1
+                new_cars_by_type.setdefault(car.type, []).append(car)
+
+        for car_type, new_cars in new_cars_by_type.items():
+            with self.get_type_lock(car_type):
+                heaps = self.available_cars.setdefault(car_type, {})
+                for car in new_cars:
+                    self.count_car(car)
+                    if car.availability:
+                        # New cars have the largest positions, so appending them keeps the order of the heap
+                        heaps.setdefault(car.circle, []).append((car.position, next(self.heap_counter), car))
+                        car.indexed_position = car.position
+                self.maintenance.cars_added(car_type, new_cars)
+        for car in existing_cars:
+            self.update_car(car)
+
+    @journaled(lambda self, car: [Journal.car_to_record(car)])
+    def update_car(self, car):
+        with self.registry_lock:
+            old_car = self.cars.get(car.license_plate)
+            if old_car is None:
+                return
+            self.cars[car.license_plate] = car
+        with self.get_type_lock(old_car.type):
+            old_car.rent_it_now = None
+            self.count_car(old_car, -1)
+            if old_car is not car:
+                self.maintenance.car_removed(old_car)
+        with self.get_type_lock(car.type):
+            car.rent_it_now = self
+            car.position = old_car.position
+            self.count_car(car)
+            if car.in_service and old_car is not car and car.release_time is not None:
+                self.maintenance.restore_service(car)
+            self.car_availability_changed(car)
+            self.car_distance_changed(car)
+    
+    @journaled(lambda self, license_plate: [license_plate])
+    def remove_car(self, license_plate):
+        with self.registry_lock:
+            car = self.cars.pop(license_plate, None)
+        if car is not None:
+            with self.get_type_lock(car.type):
+                car.rent_it_now = None
+                self.count_car(car, -1)
+                self.maintenance.car_removed(car)
+
+    def remove_cars(self, license_plates):
+        for license_plate in license_plates:
+            self.remove_car(license_plate)
+
+    def update_fleet_counters(self, car_type, cars=0, available=0, in_service=0, serviced=0, distance=0, circle=None):
+        # Called under the lock of the car type
+        counters = self.fleet_counters.get(car_type)
+        if counters is None:
+            counters = self.fleet_counters[car_type] = dict.fromkeys(self.FLEET_COUNTERS, 0)
+        counters["cars"] += cars
+        counters["available"] += available
+        counters["in_service"] += in_service
+        counters["serviced"] += serviced
+        counters["distance"] += distance
+        if available:
+            self.available_by_circle[car_type, circle] = self.available_by_circle.get((car_type, circle), 0) + available
+
+    def get_counted_state(self, car):
+        state = (car.type, car.availability, car.in_service, car.serviced, car.circle)
+        return self.counted_states.setdefault(state, state)
+
+    def count_car(self, car, sign=1):
+        # Adds the car to the counters of its type, or removes it (sign -1) with the values it was counted with: they are
+        # not its current values when the attributes were changed directly before update_car or remove_car
+        if sign > 0:
+            car.counted_state, car.counted_distance = self.get_counted_state(car), car.total_distance
+        car_type, available, in_service, serviced, circle = car.counted_state
+        self.update_fleet_counters(car_type, sign, sign * available, sign * in_service, sign * serviced,
+                                   sign * car.counted_distance, circle)
+
+    def recount_car(self, car):
+        # Moves the car in the counters from the values it was counted with to its current ones, after a method of Car
+        state = (car.type, car.availability, car.in_service, car.serviced, car.circle)
+        state = self.counted_states.setdefault(state, state)
+        old_state = car.counted_state
+        if state is old_state:
+            return
+        if state[0] != old_state[0]:
+            self.count_car(car, -1)
+            self.count_car(car)
+            return
+        car_type, available, in_service, serviced, circle = state
+        _, old_available, old_in_service, old_serviced, old_circle = old_state
+        counters = self.fleet_counters[car_type]
+        counters["available"] += available - old_available
+        counters["in_service"] += in_service - old_in_service
+        counters["serviced"] += serviced - old_serviced
+        available_by_circle = self.available_by_circle
+        if circle is not old_circle or available != old_available:
+            if old_available:
+                available_by_circle[car_type, old_circle] -= 1
+            if available:
+                available_by_circle[car_type, circle] = available_by_circle.get((car_type, circle), 0) + 1
+        car.counted_state = state
+
+    def recount_distance(self, car):
+        self.fleet_counters[car.type]["distance"] += car.total_distance - car.counted_distance
+        car.counted_distance = car.total_distance
+
+    def fleet_summary(self):
+        summary = {"types": {}}
+        totals = dict.fromkeys(self.FLEET_COUNTERS + ["rented"], 0)
+        for car_type in Car.TYPE_PRICES:
+            counters = dict(self.fleet_counters.get(car_type) or dict.fromkeys(self.FLEET_COUNTERS, 0))
+            # A car in service is not available, but it's not rented either
+            counters["rented"] = counters["cars"] - counters["available"] - counters["in_service"]
+            summary["types"][car_type] = counters
+            for name, value in counters.items():
+                totals[name] += value
+        summary.update(totals)
+        summary["revenue"] = self.ledger.get_revenue()
+        summary["bank_account"] = self.get_bank_account()
+        return summary
+
+    def check_fleet_counters(self):
+        # Counts the whole fleet again and returns (car type, counter, counted value, expected value) for every mismatch
+        expected = {}
+        expected_by_circle = {}
+        for car in self.iterate_cars():
+            counters = expected.setdefault(car.type, dict.fromkeys(self.FLEET_COUNTERS, 0))
+            counters["cars"] += 1
+            counters["available"] += car.availability
+            counters["in_service"] += car.in_service
+            counters["serviced"] += car.serviced
+            counters["distance"] += car.total_distance
+            if car.availability:
+                expected_by_circle[car.type, car.circle] = expected_by_circle.get((car.type, car.circle), 0) + 1
+
+        mismatches = []
+        for car_type in set(expected) | set(self.fleet_counters):
+            counted = self.fleet_counters.get(car_type) or dict.fromkeys(self.FLEET_COUNTERS, 0)
+            for name in self.FLEET_COUNTERS:
+                expected_value = expected.get(car_type, {}).get(name, 0)
+                if counted[name] != expected_value:
+                    mismatches.append((car_type, name, counted[name], expected_value))
+        for car_type, circle in set(expected_by_circle) | set(self.available_by_circle):
+            counted = self.available_by_circle.get((car_type, circle), 0)
+            expected_value = expected_by_circle.get((car_type, circle), 0)
+            if counted != expected_value:
+                name = f"available in {circle.name if circle is not None else 'unknown circle'}"
+                mismatches.append((car_type, name, counted, expected_value))
+        return mismatches
+
+    def car_availability_changed(self, car):
+        if not car.availability:
+            # Cars that become unavailable stay in the heap and are skipped by find_best_car
+            return
+        if car.indexed_position != car.position:
+            heap = self.available_cars.setdefault(car.type, {}).setdefault(car.circle, [])
+            heapq.heappush(heap, (car.position, next(self.heap_counter), car))
+            car.indexed_position = car.position
+        self.maintenance.car_available(car)
+
+    def car_distance_changed(self, car):
+        self.maintenance.distance_changed(car)
+
+    def is_indexed_car_available(self, car, position, circle):
+        return car.rent_it_now is self and car.position == position and car.circle is circle and car.availability
+
+    @staticmethod
+    def get_pickup_distance(car_circle, start_circle):
+        # Km driven without the user to reach the starting circle; 0 when the car is already there or its location is unknown
+        if car_circle is None or start_circle is None:
+            return 0
+        return car_circle.distance_to(start_circle) - car_circle.distance_to(car_circle)
+    
+    def iterate_users(self):
+        for user in self.users.values():
+            yield user
+
+    def get_user(self, driving_license):
+        return self.users.get(driving_license)
+            
+    @journaled(lambda self, user: [Journal.user_to_record(user)])
+    def add_user(self, user):
+        self.users[user.driving_license] = user
+
+    def add_users(self, users):
+        for user in users:
+            self.add_user(user)
+
+    @journaled(lambda self, user: [Journal.user_to_record(user)])
+    def update_user(self, user):
+        if user.driving_license in self.users:
+            self.users[user.driving_license] = user
+
+    @journaled(lambda self, driving_license: [driving_license])
+    def remove_user(self, driving_license):
+        self.users.pop(driving_license, None)
+
+    @journaled(lambda self, amount, kind="payment", car=None, user=None, circle=None: [Journal.entry_to_record((amount, kind, car, user, circle))])
+    def update_bank_account(self, amount, kind="payment", car=None, user=None, circle=None):
+        metrics = self.metrics
+        start = time.perf_counter() if metrics is not None else 0
+        self.ledger.record(self.current_time, [(amount, kind, car, user, circle)])
+        if metrics is not None:
+            metrics.increment("ledger_entries_total", kind=kind)
+            metrics.observe("ledger_update_seconds", time.perf_counter() - start)
+
+    @journaled(lambda self, entries: [[Journal.entry_to_record(entry) for entry in entries]])
+    def update_bank_account_batch(self, entries):
+        # entries are tuples (amount, kind, car, user, circle)
+        metrics = self.metrics
+        start = time.perf_counter() if metrics is not None else 0
+        self.ledger.record(self.current_time, entries)
+        if metrics is not None:
+            for entry in entries:
+                metrics.increment("ledger_entries_total", kind=entry[1])
+            metrics.observe("ledger_update_seconds", time.perf_counter() - start)
+
+    def get_bank_account(self):
+        return self.ledger.get_balance()
+
+    def get_first_release_time(self, car_type: str):
+        heap = self.release_times.get(car_type, [])
+
+        while heap:
+            release_time, _, car = heap[0]
+            if car.rent_it_now is self and not car.availability and car.release_time == release_time:
+                return release_time
+            heapq.heappop(heap)
+
+        return None
+
+    def expected_waiting_time(self, car_type: str):
+        with self.get_type_lock(car_type):
+            release_time = self.get_first_release_time(car_type)
+        if release_time is None:
+            return None
+        return max(release_time - self.current_time, 0)
+
+    def set_release_time(self, car, release_time):
+        car.release_time = release_time
+        # Also drops the cars already released from the top of the heap, so it doesn't grow with every rental
+        self.get_first_release_time(car.type)
+        heap = self.release_times.setdefault(car.type, [])
+        heapq.heappush(heap, (release_time, next(self.heap_counter), car))
+
+    @journaled(lambda self, car, start_circle, destination_circle, price_type=None:
+               [car.license_plate, start_circle.name, destination_circle.name, price_type])
+    def rent_car(self, car, start_circle, destination_circle, price_type=None):
+        # price_type is the requested car type when the car is an upgrade
+        total_distance = start_circle.distance_to(destination_circle)
+        pickup_distance = self.get_pickup_distance(car.circle, start_circle)
+        cost, travel_time = self.pricing.quote(car.type, start_circle, destination_circle)
+        if price_type is not None:
+            cost = self.pricing.quote(price_type, start_circle, destination_circle)[0]
+        car.travel_time = travel_time
+        car.reserve()
+        car.move_to(destination_circle)
+        self.set_release_time(car, self.current_time + travel_time)
+
+        # If the trip makes the car due for service, the service day starts at the end of the trip
+        car.set_total_distance(pickup_distance + total_distance, self)
+        return travel_time, cost
+
+    def get_matching_types(self, car_type: str, num_passengers: int):
+        matching_types = self.matching_types.get((car_type, num_passengers))
+        if matching_types is None:
+            capacity = Car.TYPE_CAPACITIES[car_type]
+            # A group too large for the requested type is refused: an upgrade is only for a type with no free car,
+            # and it's paid at the price of the requested type
+            matching_types = [car_type] if num_passengers <= capacity else []
+            if self.allow_upgrades and matching_types:
+                matching_types += [larger_type for larger_type in Car.TYPES_BY_CAPACITY if Car.TYPE_CAPACITIES[larger_type] > capacity]
+            self.matching_types[(car_type, num_passengers)] = matching_types
+        return matching_types
+
+    def reserve_best_car(self, car_type: str, num_passengers: int, start_circle, destination_circle):
+        # Finding and renting the car under the locks of the matching types, so two threads never get the same car
+        locks = [self.get_type_lock(matching_type) for matching_type in self.get_matching_types(car_type, num_passengers)]
+        for lock in locks:
+            lock.acquire()
+        try:
+            car = self.find_best_car(car_type, num_passengers, start_circle, destination_circle)
+            self.record_request(car_type, start_circle, destination_circle, car)
+            if car is None:
+                return None
+            travel_time, cost = self.rent_car(car, start_circle, destination_circle, car_type if car.type != car_type else None)
+            return car, travel_time, cost
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    @journaled(lambda self, now: [now])
+    def advance_time(self, now):
+        self.current_time = now
+        self.maintenance.release_serviced_cars()
+        if self.surge_interval is not None and now >= self.next_surge_update:
+            self.update_surge()
+
+    def enable_surge_pricing(self, demand_stats=None, interval=1):
+        if demand_stats is not None:
+            self.demand_stats = demand_stats
+        elif self.demand_stats is None:
+            self.demand_stats = DemandStats()
+        self.surge_interval = interval
+        self.update_surge()
+
+    def disable_surge_pricing(self):
+        self.surge_interval = None
+        self.next_surge_update = None
+        self.pricing.reset_surges()
+
+    def update_surge(self):
+        window_hours = self.demand_stats.num_buckets * self.demand_stats.bucket_hours
+        for car_type in Car.TYPE_PRICES:
+            # Cars with an unknown location can pick up users in every circle
+            unknown_location = self.available_by_circle.get((car_type, None), 0)
+            for circle in self.circles.values():
+                requests_per_hour = self.demand_stats.get("requests", car_type, circle.name) / window_hours
+                available = self.available_by_circle.get((car_type, circle), 0) + unknown_location
+                self.pricing.set_surge(car_type, circle, PricingEngine.get_surge(requests_per_hour, available))
+        self.next_surge_update = self.current_time + self.surge_interval
+
+    def reserve_batch(self, requests):
+        # Every request is checked before taking any lock, so a bad request doesn't stop the batch halfway
+        checked_requests = []
+        for user, car_type, num_passengers, start_circle, destination_circle in requests:
+            if car_type not in Car.TYPE_CAPACITIES:
+                raise ValueError(f"Invalid car type: {car_type}")
+            checked_requests.append((user, car_type, num_passengers,
+                                     Circle(start_circle) if isinstance(start_circle, str) else start_circle,
+                                     Circle(destination_circle) if isinstance(destination_circle, str) else destination_circle))
+
+        results = [None] * len(checked_requests)
+        requests_by_type = {}
+        for idx, request in enumerate(checked_requests):
+            requests_by_type.setdefault(request[1], []).append(idx)
+
+        payments = []
+        try:
+            for car_type, indexes in requests_by_type.items():
+                # The locks of all the types the requests may get, from the smallest class to the largest
+                lock_types = {matching_type for idx in indexes
+                              for matching_type in self.get_matching_types(car_type, checked_requests[idx][2])}
+                with contextlib.ExitStack() as locks:
+                    for lock_type in Car.TYPES_BY_CAPACITY:
+                        if lock_type in lock_types:
+                            locks.enter_context(self.get_type_lock(lock_type))
+                    waiting_time = None
+                    for idx in indexes:
+                        user, _, num_passengers, start_circle, destination_circle = checked_requests[idx]
+                        matching_types = self.get_matching_types(car_type, num_passengers)
+                        car = None
+                        for matching_type in matching_types:
+                            car = self.take_best_car(matching_type, start_circle)
+                            if car is not None:
+                                break
+                        self.record_request(car_type, start_circle, destination_circle, car)
+                        if car is None:
+                            if not matching_types:
+                                # The group doesn't fit in any car it can get, so there is nothing to wait for
+                                results[idx] = {"user": user, "car": None, "waiting_time": None}
+                                continue
+                            if waiting_time is None:
+                                release_time = self.get_first_release_time(car_type)
+                                waiting_time = max(release_time - self.current_time, 0) if release_time is not None else None
+                            results[idx] = {"user": user, "car": None, "waiting_time": waiting_time}
+                            continue
+
+                        travel_time, cost = self.rent_car(car, start_circle, destination_circle, car_type if car.type != car_type else None)
+                        payments.append((cost, "payment", car, user, start_circle))
+                        results[idx] = {"user": user, "car": car, "travel_time": travel_time, "cost": cost}
+
+            if self.metrics is not None:
+                # Labelled with the requested car type like in User.reserve_car, the upgrades also by the rented type
+                for request, result in zip(checked_requests, results):
+                    car_type, car = request[1], result["car"]
+                    if car is None:
+                        self.metrics.increment("reservation_misses_total", fallback="waiting_time" if result["waiting_time"] is not None else "none")
+                        continue
+                    self.metrics.increment("reservations_total", car_type=car_type)
+                    if car.type != car_type:
+                        self.metrics.increment("upgrades_total", car_type=car_type, upgraded_type=car.type)
+        finally:
+            # The cars already rented are charged even if the batch stops with an error
+            self.update_bank_account_batch(payments)
+        return results
+
+    def get_nearest_heap(self, car_type: str, start_circle):
+        # Drops the unavailable cars from the top of the heaps of the circles, and returns the heap whose top car is
+        # the nearest to the starting circle with the number of heap entries visited
+        best_key = best_heap = None
+        scanned = 0
+        heaps = self.available_cars.get(car_type, {})
+        if start_circle is None:
+            circles = [(0, circle) for circle in heaps]
+        else:
+            # The circles are visited from the nearest one and the search stops at the first distance with a car,
+            # so the dispatch doesn't look at every circle of a large town. Cars with an unknown location are at 0 km.
+            circles = itertools.chain([(0, None)], start_circle.pickup_order)
+        for pickup_distance, circle in circles:
+            if best_key is not None and pickup_distance > best_key[0]:
+                break
+            if self.max_pickup_distance is not None and pickup_distance > self.max_pickup_distance:
+                break
+            heap = heaps.get(circle)
+            while heap:
+                scanned += 1
+                position, _, car = heap[0]
+                if self.is_indexed_car_available(car, position, circle):
+                    key = (pickup_distance, position)
+                    if best_key is None or key < best_key:
+                        best_key, best_heap = key, heap
+                    break
+                heapq.heappop(heap)
+                if car.indexed_position == position and car.circle is circle:
+                    car.indexed_position = None
+        return best_heap, scanned
+
+    def take_car_in_circle(self, car_type: str, circle):
+        # Takes the first available car of the type waiting in the circle, or None
+        with self.get_type_lock(car_type):
+            heap = self.available_cars.get(car_type, {}).get(circle, [])
+            while heap:
+                position, _, car = heapq.heappop(heap)
+                if car.indexed_position == position and car.circle is circle:
+                    car.indexed_position = None
+                if self.is_indexed_car_available(car, position, circle):
+                    return car
+            return None
+
+    @journaled(lambda self, car, circle: [car.license_plate, circle.name])
+    def reposition_car(self, car, circle):
+        with self.get_type_lock(car.type):
+            distance = self.get_pickup_distance(car.circle, circle)
+            car.move_to(circle)
+            car.set_total_distance(distance, self)
+            return distance
+
+    def record_request(self, car_type: str, start_circle, destination_circle, car):
+        if self.demand_stats is not None:
+            self.demand_stats.record(self.current_time, car_type, start_circle, destination_circle, car is not None)
+
+    def take_best_car(self, car_type: str, start_circle=None):
+        # Takes the nearest available car straight from its heap, so it is not scanned again by the next request
+        heap, _ = self.get_nearest_heap(car_type, start_circle)
+        if heap is None:
+            return None
+        _, _, car = heapq.heappop(heap)
+        car.indexed_position = None
+        return car
+
+    def find_best_car(self, car_type: str, num_passengers: int, start_circle, destination_circle):
+        metrics = self.metrics
+        start = time.perf_counter() if metrics is not None else 0
+        scanned = 0
+        best_car = None
+        for matching_type in self.get_matching_types(car_type, num_passengers):
+            heap, type_scanned = self.get_nearest_heap(matching_type, start_circle)
+            scanned += type_scanned
+            if heap is not None:
+                best_car = heap[0][2]
+                break
+
+        if metrics is not None:
+            if best_car is not None and best_car.type != car_type:
+                metrics.increment("upgrades_total", car_type=car_type, upgraded_type=best_car.type)
+            metrics.increment("fleet_scans_total", car_type=car_type)
+            metrics.increment("fleet_scanned_cars_total", scanned, car_type=car_type)
+            metrics.observe("find_best_car_seconds", time.perf_counter() - start, car_type=car_type)
+        return best_car
+
+
+# The **Car** class stores all the informations related to a car and it also has the methods to: 
+# 
+# reserve a car,
+# 
+# calculate the travel time and cost of a car based on its type,
+# 
+# do the service of a car every 1500km.
+# 
+# **Car** and **User** use **__slots__**, so the objects don't carry a **__dict__** each: this is most of the memory of a car when the whole national fleet is loaded in one **RentItNow**. The car type stays a string because the same string object is shared by all the cars of a type.
+
+class Car:
+    TYPE_PRICES = {
+        "ECO": 1,
+        "MID-CLASS": 2,
+        "DELUXE": 5,
+    }
+
+    TYPE_SPEEDS = {
+        "ECO": 15,
+        "MID-CLASS": 25,
+        "DELUXE": 50,
+    }
+
+    # Maximum number of passengers
+    TYPE_CAPACITIES = {
+        "ECO": 2,
+        "MID-CLASS": 4,
+        "DELUXE": 7,
+    }
+    TYPES_BY_CAPACITY = sorted(TYPE_CAPACITIES, key=TYPE_CAPACITIES.get)
+
+    # No per-instance __dict__, to keep the memory of large fleets low
+    __slots__ = ("type", "license_plate", "brand", "name", "total_distance", "next_service_distance", "availability",
+                 "travel_time", "serviced", "rent_it_now", "position", "indexed_position", "release_time", "in_service",
+                 "circle", "counted_state", "counted_distance", "__weakref__")
+
+    def __init__(self, car_type, license_plate, brand, name, circle=None):
+        self.type = car_type
+        self.license_plate = license_plate
+        self.brand = brand
+        self.name = name
+        self.total_distance = 0
+        self.next_service_distance = 1500
+        self.availability = True
+        self.travel_time = 0
+        self.serviced = False
+        self.rent_it_now = None
+        self.position = None
+        self.indexed_position = None
+        self.release_time = None
+        self.in_service = False
+        self.circle = Circle(circle) if isinstance(circle, str) else circle
+        # The values the car was last counted with in the fleet counters of its RentItNow
+        self.counted_state = None
+        self.counted_distance = 0
+    
+    def calculate_cost(self, distance):
+        return distance * self.TYPE_PRICES[self.type]
+
+    def calculate_travel_time(self, distance):
+        self.travel_time = distance / self.TYPE_SPEEDS[self.type]
+        return distance / self.TYPE_SPEEDS[self.type]
+        
+    def get_travel_time(self):
+        return self.travel_time
+        
+    @property
+    def journal(self):
+        return self.rent_it_now.journal if self.rent_it_now is not None else None
+
+    def get_lock(self):
+        # The lock of the car type in its RentItNow, taken by the methods that are also called from outside RentItNow
+        return self.rent_it_now.get_type_lock(self.type) if self.rent_it_now is not None else contextlib.nullcontext()
+
+    @journaled(lambda self, rent_it_now, charge=True: [self.license_plate, charge])
+    def service(self, rent_it_now: RentItNow, charge=True):
+        with self.get_lock():
+            self.next_service_distance = self.total_distance + 1500
+            self.availability = False
+            if charge:
+                rent_it_now.update_bank_account(-300, kind="service", car=self)
+            self.serviced = True
+            self.in_service = True
+            self.recount()
+            self.availability_changed()
+            rent_it_now.maintenance.service_started(self)
+            if rent_it_now.metrics is not None:
+                rent_it_now.metrics.increment("services_total", car_type=self.type)
+        
+    @journaled(lambda self: [self.license_plate])
+    def reserve(self):
+        self.availability = False
+        self.recount()
+        self.availability_changed()
+
+    @journaled(lambda self: [self.license_plate])
+    def make_available(self):
+        with self.get_lock():
+            self.availability = True
+            self.release_time = None
+            self.in_service = False
+            self.recount()
+            self.availability_changed()
+
+    @journaled(lambda self, circle: [self.license_plate, circle.name if circle is not None else None])
+    def move_to(self, circle):
+        if circle is not self.circle:
+            self.circle = circle
+            self.recount()
+            # The entry in the heap of the old circle is not valid anymore, the car is added to the heap of the new circle
+            self.indexed_position = None
+            self.availability_changed()
+
+    def recount(self):
+        if self.rent_it_now is not None:
+            self.rent_it_now.recount_car(self)
+
+    def availability_changed(self):
+        if self.rent_it_now is not None:
+            self.rent_it_now.car_availability_changed(self)
+
+    def set_total_distance(self, distance, rent_it_now: RentItNow):
+        self.total_distance += distance
+        if self.rent_it_now is not None:
+            self.rent_it_now.recount_distance(self)
+        rent_it_now.car_distance_changed(self)
+        
+    def print_car_info(self):
+        print(self.license_plate)
+        print(self.type)
+        print(f"Total Distance Traveled: {self.total_distance} km")
+        print(f"Next Service at: {self.next_service_distance} km")
+        print(f"Availability: {'Available' if self.availability else 'Not Available'}")
+        print(f"Service: {'Done' if self.serviced else 'Not done'}")
+
+
+# **MaintenanceScheduler** decides when the cars are serviced. A car is due for service when its **total_distance** reaches its **next_service_distance** (also when a trip goes past it, e.g. from 1495 km to 1505 km).
+# 
+# For every car type it keeps a heap keyed on the km left before the next service, so **cars_due_within** returns the cars due within some km visiting only the matching entries of the heap. At most **max_in_service_per_type** cars of a type are in service at the same time (None means no limit); the other due cars keep working until a place is free. A car removed from the fleet, or replaced by another object in **update_car**, gives its place back. The service of a rented car starts at the end of its trip, and after one day (**RentItNow.advance_time**) the car is available again. The 300$ of all the cars serviced together are charged with a single **update_bank_account_batch** call.
+
+class MaintenanceScheduler:
+    SERVICE_COST = 300
+
+    def __init__(self, rent_it_now: RentItNow, max_in_service_per_type=None):
+        self.rent_it_now = rent_it_now
+        self.max_in_service_per_type = max_in_service_per_type
+        self.remaining_distances = {}  # car type -> heap of (km to next service, counter, car)
+        self.due_cars = {}  # car type -> due cars waiting for a free place, by license plate
+        self.in_service = {}  # car type -> cars in service
+        self.service_ends = []  # heap of (end of service, counter, car)
+        self.rebuilt_sizes = {}  # car type -> size of the heap of remaining distances when it was last rebuilt
+        self.counter = itertools.count()
+        # The structures of a car type are used under the lock of that type in RentItNow, this lock is only for service_ends
+        self.service_ends_lock = threading.Lock()
+
+    def distance_changed(self, car):
+        remaining_distance = car.next_service_distance - car.total_distance
+        heap = self.remaining_distances.setdefault(car.type, [])
+        if len(heap) > 2 * self.rebuilt_sizes.get(car.type, 0) + 64:
+            heap = self.rebuild_remaining_distances(car.type)
+        heapq.heappush(heap, (remaining_distance, next(self.counter), car))
+
+        if remaining_distance <= 0 and not car.in_service:
+            self.due_cars.setdefault(car.type, {})[car.license_plate] = car
+            self.service_due_cars(car.type)
+
+    def cars_added(self, car_type, cars):
+        heap = self.remaining_distances.setdefault(car_type, [])
+        counter = self.counter
+        due = False
+        for car in cars:
+            remaining_distance = car.next_service_distance - car.total_distance
+            heapq.heappush(heap, (remaining_distance, next(counter), car))
+            if remaining_distance <= 0 and not car.in_service:
+                self.due_cars.setdefault(car_type, {})[car.license_plate] = car
+                due = True
+        if due:
+            self.service_due_cars(car_type)
+
+    def rebuild_remaining_distances(self, car_type):
+        # Drops the entries left behind by the cars that drove since they were pushed; every car in the fleet has
+        # its latest entry in the heap, so the valid entries are enough and the rest of the fleet is not visited
+        valid_entries = {}
+        for entry in self.remaining_distances[car_type]:
+            remaining_distance, _, car = entry
+            if car.rent_it_now is self.rent_it_now and car.next_service_distance - car.total_distance == remaining_distance:
+                valid_entries[car.license_plate] = entry
+        self.remaining_distances[car_type] = list(valid_entries.values())
+        heapq.heapify(self.remaining_distances[car_type])
+        self.rebuilt_sizes[car_type] = len(self.remaining_distances[car_type])
+        return self.remaining_distances[car_type]
+
+    def cars_due_within(self, distance, car_type=None):
+        car_types = [car_type] if car_type else list(self.remaining_distances)
+        due_cars = {}
+        for car_type in car_types:
+            with self.rent_it_now.get_type_lock(car_type):
+                heap = self.remaining_distances.get(car_type, [])
+                # Children in the heap are never smaller than their parent, so a branch stops at the first entry too far away
+                stack = [0] if heap else []
+                while stack:
+                    idx = stack.pop()
+                    remaining_distance, _, car = heap[idx]
+                    if remaining_distance > distance:
+                        continue
+                    if car.rent_it_now is self.rent_it_now and car.next_service_distance - car.total_distance == remaining_distance:
+                        due_cars[car.license_plate] = car
+                    stack.extend(child for child in (2 * idx + 1, 2 * idx + 2) if child < len(heap))
+        return sorted(due_cars.values(), key=lambda car: car.next_service_distance - car.total_distance)
+
+    def service_due_cars(self, car_type):
+        due_cars = self.due_cars.get(car_type)
+        if not due_cars:
+            return
+
+        in_service = self.in_service.setdefault(car_type, set())
+        free_places = len(due_cars)
+        if self.max_in_service_per_type is not None:
+            free_places = min(free_places, self.max_in_service_per_type - len(in_service))
+
+        cars = []
+        for license_plate in list(due_cars):
+            if len(cars) >= free_places:
+                break
+            car = due_cars.pop(license_plate)
+            if car.rent_it_now is self.rent_it_now:
+                cars.append(car)
+
+        for car in cars:
+            car.service(self.rent_it_now, charge=False)
+        if cars:
+            self.rent_it_now.update_bank_account_batch([(-self.SERVICE_COST, "service", car, None, None) for car in cars])
+
+    def car_removed(self, car):
+        # Called under the lock of the car type when the car leaves the fleet, or is replaced by another object in update_car;
+        # its place in service goes to the next due car, and its end of service is skipped by release_serviced_cars
+        due_cars = self.due_cars.get(car.type)
+        if due_cars and due_cars.get(car.license_plate) is car:
+            del due_cars[car.license_plate]
+        in_service = self.in_service.get(car.type)
+        if in_service and car in in_service:
+            in_service.discard(car)
+            self.service_due_cars(car.type)
+
+    def service_started(self, car):
+        # A rented car goes to service at the end of its trip
+        start = max(car.release_time or self.rent_it_now.current_time, self.rent_it_now.current_time)
+        end = start + self.rent_it_now.SERVICE_DURATION
+        self.rent_it_now.set_release_time(car, end)
+        self.in_service.setdefault(car.type, set()).add(car)
+        self.due_cars.get(car.type, {}).pop(car.license_plate, None)
+        with self.service_ends_lock:
+            heapq.heappush(self.service_ends, (end, next(self.counter), car))
+        self.distance_changed(car)
+
+    def car_available(self, car):
+        in_service = self.in_service.get(car.type)
+        if in_service and car in in_service:
+            in_service.discard(car)
+            self.service_due_cars(car.type)
+        elif car.license_plate in self.due_cars.get(car.type, {}):
+            self.service_due_cars(car.type)
+
+    def restore_service(self, car):
+        self.in_service.setdefault(car.type, set()).add(car)
+        with self.service_ends_lock:
+            heapq.heappush(self.service_ends, (car.release_time, next(self.counter), car))
+
+    def release_serviced_cars(self):
+        ended = []
+        with self.service_ends_lock:
+            service_ends = self.service_ends
+            while service_ends and service_ends[0][0] <= self.rent_it_now.current_time:
+                ended.append(heapq.heappop(service_ends))
+
+        # make_available takes the lock of the car type, so it's called after releasing service_ends_lock
+        for end, _, car in ended:
+            if car.rent_it_now is self.rent_it_now and car.in_service and car.release_time == end:
+                car.make_available()
+
+
+# **Ledger** is the book of **RentItNow**: every payment of a trip and every service charge is recorded with the time, the car, the user and the starting circle. The amounts are kept as integer cents, so they are exact, and **get_balance** and the totals return **Decimal** values. **RentItNow.get_bank_account** reads the balance from the ledger.
+# 
+# The records are stored column by column in compact arrays (times, cents, kind, and small integer ids for the car, the user and the circle), and are never modified. The balance and the totals per car, car type, circle and user are updated at every record, so reading them is a dictionary lookup per shard. A prefix sum of the payments is stored with every record, so **revenue_between** finds the revenue of a time range with two binary searches instead of reading the history again.
+# 
+# Every thread records in its own **LedgerShard** (columns and running totals), so the threads that pay for their trips at the same time don't wait for each other and no record is lost; only a new car, user or circle takes the short lock of the ids. The readers sum the shards, which are few (one per thread that recorded something), and **iterate_records** merges them by time.
+
+class LedgerShard:
+    def __init__(self):
+        self.times = array.array("d")
+        self.cents = array.array("q")
+        self.kinds = array.array("b")
+        self.car_ids = array.array("l")
+        self.user_ids = array.array("l")
+        self.circle_ids = array.array("l")
+        self.revenue_prefix = array.array("q")  # payments of the shard up to and including each record, in cents
+        self.balance = 0
+        self.revenue = 0
+        self.totals_by_car = {}
+        self.totals_by_type = {}
+        self.totals_by_circle = {}
+        self.totals_by_user = {}
+        self.archived = 0  # records already appended to the archive
+        self.unloaded = 0  # records of the archive not read back yet, after a recovery
+
+
+class Ledger:
+    KINDS = ["payment", "service", "adjustment"]
+    KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+    COLUMNS = ("times", "cents", "kinds", "car_ids", "user_ids", "circle_ids", "revenue_prefix")
+    TOTALS = ("totals_by_car", "totals_by_type", "totals_by_circle", "totals_by_user")
+
+    # Stands for a car that is not in memory anymore, e.g. when the records are replayed from the journal
+    Key = namedtuple("Key", ["license_plate", "type"])
+
+    def __init__(self):
+        self.shards = {}  # thread id -> LedgerShard, written only by its thread
+        self.keys = []  # id -> license plate, driving license or circle name
+        self.key_ids = {}
+        self.keys_lock = threading.Lock()
+        self.archive_path = None
+        self.archive_lock = threading.Lock()
+
+    @staticmethod
+    def get_key(value):
+        if value is None or type(value) is str:
+            return value
+        if type(value) is Car or isinstance(value, (Car, Ledger.Key)):
+            return value.license_plate
+        if isinstance(value, User):
+            return value.driving_license
+        return value.name
+
+    @staticmethod
+    def to_cents(amount):
+        if isinstance(amount, int):
+            return amount * 100
+        return int(Decimal(str(amount)) * 100)
+
+    @staticmethod
+    def from_cents(cents):
+        return Decimal(cents) / 100
+
+    def get_key_id(self, key):
+        if key is None:
+            return -1
+        key_id = self.key_ids.get(key)
+        if key_id is None:
+            with self.keys_lock:
+                key_id = self.key_ids.get(key)
+                if key_id is None:
+                    # The key is in the list before its id is published, so the readers always find it
+                    self.keys.append(key)
+                    key_id = self.key_ids[key] = len(self.keys) - 1
+        return key_id
+
+    @staticmethod
+    def add_total(totals, key, cents):
+        if key is not None:
+            totals[key] = totals.get(key, 0) + cents
+
+    def get_shards(self):
+        return list(self.shards.values())
+
+    def get_loaded_shards(self):
+        shards = self.get_shards()
+        if any(shard.unloaded for shard in shards):
+            self.load_archive()
+        return shards
+
+    def record(self, time, entries):
+        shard = self.shards.get(threading.get_ident())
+        if shard is None:
+            shard = self.shards.setdefault(threading.get_ident(), LedgerShard())
+        # Time never goes back in a shard, so its records stay sorted for revenue_between
+        times = shard.times
+        if times and time < times[-1]:
+            time = times[-1]
+        revenue, balance = shard.revenue, shard.balance
+        get_key, get_key_id, add_total = self.get_key, self.get_key_id, self.add_total
+        for amount, kind, car, user, circle in entries:
+            cents = amount * 100 if type(amount) is int else self.to_cents(amount)
+            car_key, user_key, circle_key = get_key(car), get_key(user), get_key(circle)
+            if kind == "payment":
+                revenue += cents
+
+            shard.revenue_prefix.append(revenue)
+            shard.cents.append(cents)
+            shard.kinds.append(self.KIND_CODES[kind])
+            shard.car_ids.append(get_key_id(car_key))
+            shard.user_ids.append(get_key_id(user_key))
+            shard.circle_ids.append(get_key_id(circle_key))
+            # The time is appended last, so the readers only see the records with all their columns
+            times.append(time)
+
+            balance += cents
+            if car is not None:
+                add_total(shard.totals_by_car, car_key, cents)
+                add_total(shard.totals_by_type, car.type, cents)
+            add_total(shard.totals_by_user, user_key, cents)
+            add_total(shard.totals_by_circle, circle_key, cents)
+        shard.revenue, shard.balance = revenue, balance
+
+    def __len__(self):
+        return sum(len(shard.times) + shard.unloaded for shard in self.get_shards())
+
+    def get_balance(self):
+        return self.from_cents(sum(shard.balance for shard in self.get_shards()))
+
+    def get_revenue(self):
+        # Payments only, without the service charges
+        return self.from_cents(sum(shard.revenue for shard in self.get_shards()))
+
+    def get_total(self, totals_name, key):
+        return self.from_cents(sum(getattr(shard, totals_name).get(key, 0) for shard in self.get_shards()))
+
+    def get_total_by_car(self, license_plate):
+        return self.get_total("totals_by_car", license_plate)
+
+    def get_total_by_type(self, car_type):
+        return self.get_total("totals_by_type", car_type)
+
+    def get_total_by_circle(self, circle_name):
+        return self.get_total("totals_by_circle", circle_name)
+
+    def get_total_by_user(self, driving_license):
+        return self.get_total("totals_by_user", driving_license)
+
+    def revenue_between(self, start, end):
+        # Payments of the records with start <= time < end
+        revenue = 0
+        for shard in self.get_loaded_shards():
+            first = bisect.bisect_left(shard.times, start)
+            last = bisect.bisect_left(shard.times, end)
+            if last > first:
+                revenue += shard.revenue_prefix[last - 1] - (shard.revenue_prefix[first - 1] if first else 0)
+        return self.from_cents(revenue)
+
+    def iterate_shard_records(self, shard):
+        keys = self.keys
+        for idx in range(len(shard.times)):
+            yield (shard.times[idx], self.from_cents(shard.cents[idx]), self.KINDS[shard.kinds[idx]],
+                   keys[shard.car_ids[idx]] if shard.car_ids[idx] >= 0 else None,
+                   keys[shard.user_ids[idx]] if shard.user_ids[idx] >= 0 else None,
+                   keys[shard.circle_ids[idx]] if shard.circle_ids[idx] >= 0 else None)
+
+    def iterate_records(self):
+        return heapq.merge(*(self.iterate_shard_records(shard) for shard in self.get_loaded_shards()), key=lambda record: record[0])
+
+    def archive(self, file):
+        # Appends the records not archived yet as JSON lines, one [time, cents, kind, car id, user id, circle id] each
+        for shard in self.get_shards():
+            if shard.unloaded:
+                continue  # all its records come from the archive
+            end = len(shard.times)
+            lines = [json.dumps([shard.times[idx], shard.cents[idx], shard.kinds[idx], shard.car_ids[idx],
+                                 shard.user_ids[idx], shard.circle_ids[idx]], separators=(",", ":")) + "\n"
+                     for idx in range(shard.archived, end)]
+            file.writelines(lines)
+            shard.archived = end
+
+    def load_archive(self):
+        # The records archived before a recovery are read back the first time a query needs them
+        with self.archive_lock:
+            for shard in self.get_shards():
+                if not shard.unloaded:
+                    continue
+                with open(self.archive_path) as file:
+                    records = [json.loads(line) for line in itertools.islice(file, shard.unloaded)]
+                # The archive has the records shard after shard, so they are sorted by time again
+                records.sort(key=lambda record: record[0])
+                columns = {name: array.array(getattr(shard, name).typecode) for name in self.COLUMNS}
+                payment, revenue = self.KIND_CODES["payment"], 0
+                for record in records:
+                    if record[2] == payment:
+                        revenue += record[1]
+                    for name, value in zip(self.COLUMNS, record):
+                        columns[name].append(value)
+                    columns["revenue_prefix"].append(revenue)
+                for name in self.COLUMNS:
+                    setattr(shard, name, columns[name])
+                shard.unloaded = 0
+
+    def to_state(self):
+        # The running totals and the ids of the keys, without the records, which are in the archive
+        shards = self.get_shards()
+        totals = []
+        for name in self.TOTALS:
+            merged = {}
+            for shard in shards:
+                for key, cents in list(getattr(shard, name).items()):
+                    merged[key] = merged.get(key, 0) + cents
+            totals.append(merged)
+        return {
+            "keys": list(self.keys),
+            "records": sum(shard.archived for shard in shards),
+            "balance": sum(shard.balance for shard in shards),
+            "revenue": sum(shard.revenue for shard in shards),
+            "totals": totals,
+        }
+
+    @classmethod
+    def from_state(cls, state, archive_path=None):
+        ledger = cls()
+        # The totals of the snapshot go to a shard with a negative id, which is never the id of a thread; its records
+        # stay in the archive until load_archive
+        shard = ledger.shards[-1] = LedgerShard()
+        shard.balance, shard.revenue = state["balance"], state["revenue"]
+        for name, totals in zip(cls.TOTALS, state["totals"]):
+            setattr(shard, name, totals)
+        shard.archived = shard.unloaded = state["records"]
+        ledger.keys = state["keys"]
+        ledger.key_ids = {key: key_id for key_id, key in enumerate(ledger.keys)}
+        ledger.archive_path = archive_path
+        return ledger
+
+
+# **PricingEngine** keeps a table with the cost and the travel time of every trip, for every car type and every pair of starting and destination circles, so **quote** is a single lookup and doesn't change the car like **Car.calculate_travel_time** does. Many threads can ask for quotes at the same time.
+# 
+# The price of a car type in a starting circle can be raised by a surge multiplier (**set_surge**), between 1 and **MAX_SURGE** in steps of **SURGE_STEP**. Only the rows of that car type and circle are computed again, and only when the multiplier changes, so a busy circle doesn't rewrite the table on every request. **get_surge** turns the requests per hour and the available cars of a circle into a multiplier.
+
+class PricingEngine:
+    MAX_SURGE = 2.0
+    SURGE_STEP = 0.25
+
+    def __init__(self, circles):
+        self.circles = list(circles)
+        self.surges = {}  # (car type, starting circle) -> multiplier, 1 when missing
+        self.quotes = {}  # (car type, starting circle, destination circle) -> (cost, travel time)
+        for car_type in Car.TYPE_PRICES:
+            for start_circle in self.circles:
+                self.update_quotes(car_type, start_circle)
+
+    def update_quotes(self, car_type, start_circle):
+        price = Car.TYPE_PRICES[car_type]
+        speed = Car.TYPE_SPEEDS[car_type]
+        surge = self.surges.get((car_type, start_circle), 1)
+        for destination_circle in self.circles:
+            distance = start_circle.distance_to(destination_circle)
+            # Without surge the cost stays an integer like Car.calculate_cost
+            cost = distance * price if surge == 1 else round(distance * price * surge, 2)
+            self.quotes[car_type, start_circle, destination_circle] = (cost, distance / speed)
+
+    def quote(self, car_type, start_circle, destination_circle):
+        # Returns (cost, travel time in hours)
+        return self.quotes[car_type, start_circle, destination_circle]
+
+    def get_multiplier(self, car_type, start_circle):
+        return self.surges.get((car_type, start_circle), 1)
+
+    def set_surge(self, car_type, start_circle, multiplier):
+        if multiplier == self.surges.get((car_type, start_circle), 1):
+            return False
+        if multiplier == 1:
+            del self.surges[car_type, start_circle]
+        else:
+            self.surges[car_type, start_circle] = multiplier
+        self.update_quotes(car_type, start_circle)
+        return True
+
+    def reset_surges(self):
+        for car_type, start_circle in list(self.surges):
+            self.set_surge(car_type, start_circle, 1)
+
+    @classmethod
+    def get_surge(cls, requests_per_hour, available):
+        # No surge while every request of the hour can find an available car
+        if requests_per_hour <= available:
+            return 1
+        ratio = requests_per_hour / max(available, 1)
+        return min(cls.MAX_SURGE, max(1, round(ratio / cls.SURGE_STEP) * cls.SURGE_STEP))
+
+
+# The **User** class stores all the information of a user and has the method **reserve_car** which assign to the user the best car if available using the method **find_best_car** described in the class **RentItNow**, if the car is not available it presents the expected waiting time until the first rented car of that type is released, it then sets all the information of the rental and make the payment to **RentItNow** bank account and prints the information of the rental.
+
+class User:
+    __slots__ = ("name", "surname", "address", "credit_card", "driving_license", "selected_car_type", "num_passengers",
+                 "start_circle", "destination_circle")
+
+    def __init__(self, name, surname, address, credit_card, driving_license, selected_car_type: str, num_passengers: int, 
+                 start_circle: str, destination_circle: str):
+        self.name = name
+        self.surname = surname
+        self.address = address
+        self.credit_card = credit_card
+        self.driving_license = driving_license
+        self.selected_car_type = selected_car_type
+        self.num_passengers = num_passengers
+        # Circle returns the shared instance for each name, the same ones stored in RentItNow.circles
+        self.start_circle = Circle(start_circle)
+        self.destination_circle = Circle(destination_circle)
+        
+    def reserve_car(self, rent_it_now: 'RentItNow'):
+        if not rent_it_now.get_matching_types(self.selected_car_type, self.num_passengers):
+            return (f"A {self.selected_car_type} car carries at most {Car.TYPE_CAPACITIES[self.selected_car_type]} passengers, "
+                    f"it can't be reserved for the {self.num_passengers} passengers of {self.name} {self.surname}.")
+
+        metrics = rent_it_now.metrics
+        start = time.perf_counter() if metrics is not None else 0
+        reservation = rent_it_now.reserve_best_car(self.selected_car_type, self.num_passengers, self.start_circle, self.destination_circle)
+        
+        if not reservation:
+            waiting_time = rent_it_now.expected_waiting_time(self.selected_car_type)
+            if metrics is not None:
+                metrics.increment("reservation_misses_total", fallback="waiting_time" if waiting_time is not None else "none")
+                metrics.observe("reservation_seconds", time.perf_counter() - start)
+            if waiting_time is None:
+                return f"No {self.selected_car_type} cars are available for {self.name} {self.surname}."
+            return f"No cars are available at the moment for {self.name} {self.surname}. The expected waiting time is {waiting_time} hours."
+        
+        best_car, travel_time, cost = reservation
+
+        rent_it_now.update_bank_account(cost, car=best_car, user=self, circle=self.start_circle)
+        if metrics is not None:
+            metrics.increment("reservations_total", car_type=self.selected_car_type)
+            metrics.observe("reservation_seconds", time.perf_counter() - start)
+        
+        return f"Car {best_car.license_plate} has been reserved to {self.name} {self.surname}. The travel time is {travel_time} hours, and the cost is ${cost}."
+
+    def print_user_info(self):
+        print("Name:", self.name)
+        print("Surname:", self.surname)
+        print("Address:", self.address)
+        print("Credit Card:", self.credit_card)
+        print("Driving License:", self.driving_license)
+        print("Selected Car Type:", self.selected_car_type)
+        print("Number of Passengers:", self.num_passengers)
+
+
+# **FleetSimulator** is a discrete-event simulation built on top of **RentItNow**. It keeps a priority queue of trip-end events, advances the **current_time** of **RentItNow** (in hours) and replays a stream of trip requests (time, car type, number of passengers, starting circle, destination circle), synthetic or recorded. Cars are returned automatically at the end of the trip, or by the **MaintenanceScheduler** one day later if they went to service.
+# 
+# It can be used to try different fleet sizes per car type before buying the cars: the result of **run** reports, per car type, the served requests, the requests that found no car available and the utilisation of the fleet (the hours on a trip until **current_time** over the hours of the fleet, so the trips still running count only for the hours already driven).
+
+class FleetSimulator:
+    def __init__(self, rent_it_now: RentItNow):
+        self.rent_it_now = rent_it_now
+        self.events = []
+        self.event_counter = itertools.count()
+        self.served = {car_type: 0 for car_type in Car.TYPE_PRICES}
+        self.missed = {car_type: 0 for car_type in Car.TYPE_PRICES}
+        self.rented_hours = {car_type: 0 for car_type in Car.TYPE_PRICES}
+
+    def schedule(self, event_time, car):
+        heapq.heappush(self.events, (event_time, next(self.event_counter), car))
+
+    def advance_to(self, now):
+        events = self.events
+        while events and events[0][0] <= now:
+            event_time, _, car = heapq.heappop(events)
+            self.rent_it_now.advance_time(event_time)
+            # Cars that went to service are returned by the MaintenanceScheduler
+            if not car.in_service:
+                car.make_available()
+        self.rent_it_now.advance_time(now)
+
+    def request_trip(self, request_time, car_type, num_passengers, start_circle, destination_circle):
+        self.advance_to(request_time)
+        rent_it_now = self.rent_it_now
+
+        reservation = rent_it_now.reserve_best_car(car_type, num_passengers, start_circle, destination_circle)
+        if reservation is None:
+            self.missed[car_type] += 1
+            return None
+
+        car, travel_time, cost = reservation
+        rent_it_now.update_bank_account(cost, car=car, circle=start_circle)
+        if not car.in_service:
+            self.schedule(car.release_time, car)
+        self.served[car_type] += 1
+        self.rented_hours[car.type] += travel_time
+        return car
+
+    def run(self, demand, until=None):
+        for request_time, car_type, num_passengers, start_circle, destination_circle in demand:
+            if until is not None and request_time > until:
+                break
+            self.request_trip(request_time, car_type, num_passengers, start_circle, destination_circle)
+
+        if until is not None:
+            self.advance_to(until)
+        return self.get_results()
+
+    def get_results(self):
+        elapsed = self.rent_it_now.current_time
+        fleet_size = {car_type: 0 for car_type in Car.TYPE_PRICES}
+        # The hours of the trips still running after current_time are not counted, so the utilisation stays below 1
+        rented_hours = dict(self.rented_hours)
+        for car in self.rent_it_now.iterate_cars():
+            fleet_size[car.type] += 1
+            if not car.availability and car.release_time is not None:
+                # The service day of a car due for service starts at the end of its trip
+                end_time = car.release_time - (self.rent_it_now.SERVICE_DURATION if car.in_service else 0)
+                if end_time > elapsed:
+                    rented_hours[car.type] -= end_time - elapsed
+
+        results = {}
+        for car_type in Car.TYPE_PRICES:
+            fleet_hours = fleet_size[car_type] * elapsed
+            results[car_type] = {
+                "cars": fleet_size[car_type],
+                "served": self.served[car_type],
+                "missed": self.missed[car_type],
+                "utilisation": rented_hours[car_type] / fleet_hours if fleet_hours else 0,
+            }
+        return results
+
+
+def generate_demand(num_requests, requests_per_hour, seed=0, start_weights=None, destination_weights=None):
+    # The weights, one per circle, make some circles more popular as start or destination
+    rng = random.Random(seed)
+    car_types = list(Car.TYPE_PRICES)
+    circles = [Circle(name) for name in Circle.NAMES]
+    request_time = 0
+    for _ in range(num_requests):
+        request_time += rng.expovariate(requests_per_hour)
+        car_type = rng.choice(car_types)
+        start_circle = rng.choices(circles, start_weights)[0] if start_weights else rng.choice(circles)
+        destination_circle = rng.choices(circles, destination_weights)[0] if destination_weights else rng.choice(circles)
+        yield request_time, car_type, 1, start_circle, destination_circle
+
+
+# **FleetQuery** answers the questions about the state of the whole fleet without printing every car. It copies the state of the cars in NumPy arrays with one pass over **iterate_cars**, then every query is a single vectorized operation on the arrays:
+# - **available_count_per_type**: number of available cars of each type,
+# - **km_until_service**: km left before the next service of each car,
+# - **utilisation**: share of the cars of each type that are rented,
+# - **top_driven**: the cars with the highest total distance.
+# 
+# **write_report** writes the status of all the cars as CSV or JSON with a single write on the file. NumPy is needed only by this class.
+
+class FleetQuery:
+    def __init__(self, rent_it_now: RentItNow):
+        if np is None:
+            raise ImportError("FleetQuery requires NumPy")
+
+        self.car_types = list(Car.TYPE_PRICES)
+        type_codes = {car_type: code for code, car_type in enumerate(self.car_types)}
+        cars = list(rent_it_now.iterate_cars())
+        for car in cars:
+            if car.type not in type_codes:
+                type_codes[car.type] = len(self.car_types)
+                self.car_types.append(car.type)
+
+        self.license_plates = np.array([car.license_plate for car in cars], dtype=object)
+        state = np.array([(type_codes[car.type], car.total_distance, car.next_service_distance, car.availability, car.in_service)
+                          for car in cars], dtype=np.int64).reshape(len(cars), 5)
+        self.types = state[:, 0]
+        self.total_distance = state[:, 1]
+        self.next_service_distance = state[:, 2]
+        self.availability = state[:, 3].astype(bool)
+        self.in_service = state[:, 4].astype(bool)
+
+    def count_per_type(self, mask=None):
+        types = self.types if mask is None else self.types[mask]
+        counts = np.bincount(types, minlength=len(self.car_types))
+        return dict(zip(self.car_types, counts.tolist()))
+
+    def available_count_per_type(self):
+        return self.count_per_type(self.availability)
+
+    def km_until_service(self):
+        return self.next_service_distance - self.total_distance
+
+    def utilisation(self):
+        rented = self.count_per_type(~self.availability & ~self.in_service)
+        cars = self.count_per_type()
+        return {car_type: rented[car_type] / cars[car_type] if cars[car_type] else 0 for car_type in self.car_types}
+
+    def top_driven(self, n):
+        n = min(n, len(self.total_distance))
+        if n == 0:
+            return []
+        top = np.argpartition(-self.total_distance, n - 1)[:n]
+        top = top[np.argsort(-self.total_distance[top], kind="stable")]
+        return list(zip(self.license_plates[top].tolist(), self.total_distance[top].tolist()))
+
+    def get_rows(self):
+        types = np.array(self.car_types, dtype=object)[self.types]
+        return zip(self.license_plates.tolist(), types.tolist(), self.total_distance.tolist(),
+                   self.next_service_distance.tolist(), self.km_until_service().tolist(),
+                   self.availability.tolist(), self.in_service.tolist())
+
+    def write_report(self, file, format="csv"):
+        columns = ["license_plate", "type", "total_distance", "next_service_distance", "km_until_service", "available", "in_service"]
+        if format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            writer.writerows(self.get_rows())
+            file.write(buffer.getvalue())
+        elif format == "json":
+            report = {
+                "available_per_type": self.available_count_per_type(),
+                "utilisation": self.utilisation(),
+                "cars": [dict(zip(columns, row)) for row in self.get_rows()],
+            }
+            file.write(json.dumps(report))
+        else:
+            raise ValueError(f"Invalid report format: {format}")
+
+
+# **Journal** saves the state of **RentItNow** on disk, so nothing is lost when the process restarts. Every change (add, update and remove of cars and users, rentals, returned cars, services, time and bank account updates) is appended as one JSON line to **journal.jsonl**. The methods that make the changes are marked with the **journaled** decorator; the changes they make through other journaled methods (e.g. the service triggered by a rental) are not recorded, because replaying the rental repeats them.
+# 
+# The lines are written and synced to disk in groups (every **group_size** records or **sync_interval** seconds), so the journal doesn't slow down the reservations; **commit** forces the write. A timer commits the last group when no other record arrives, so a change is on disk at most **sync_interval** seconds after its call returned. Every **snapshot_every** records the whole state is saved in **snapshot.json** and the journal restarts empty. **recover** loads the last snapshot and replays only the records after it.
+# 
+# The records of the ledger would make every snapshot longer than the previous one, so they are not in it: a snapshot appends the records since the previous one to **ledger.jsonl** (**Ledger.archive**) and saves only the totals, the revenue and the ids of the keys. After a recovery the archive is read only when **revenue_between** or **iterate_records** need the old records. A last line written only in part by a crash is cut off the file, so the next records start on a new line.
+
+class Journal:
+    JOURNAL_FILE = "journal.jsonl"
+    SNAPSHOT_FILE = "snapshot.json"
+    LEDGER_FILE = "ledger.jsonl"
+
+    def __init__(self, directory, group_size=256, sync_interval=0.05, snapshot_every=100_000):
+        self.directory = directory
+        self.group_size = group_size
+        self.sync_interval = sync_interval
+        self.snapshot_every = snapshot_every
+        self.rent_it_now = None
+        self.file = None
+        self.buffer = []
+        self.sequence = 0
+        self.records_since_snapshot = 0
+        self.last_sync = time.monotonic()
+        self.flush_timer = None
+        self.local = threading.local()  # depth of the journaled calls of each thread
+        self.lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def car_to_record(car):
+        return [car.type, car.license_plate, car.brand, car.name, car.total_distance, car.next_service_distance,
+                car.availability, car.travel_time, car.serviced, car.release_time, car.in_service,
+                car.circle.name if car.circle is not None else None]
+
+    @staticmethod
+    def car_from_record(record):
+        car = Car(*record[:4], circle=record[11])
+        (car.total_distance, car.next_service_distance, car.availability, car.travel_time, car.serviced,
+         car.release_time, car.in_service) = record[4:11]
+        return car
+
+    @staticmethod
+    def user_to_record(user):
+        return [user.name, user.surname, user.address, user.credit_card, user.driving_license, user.selected_car_type,
+                user.num_passengers, user.start_circle.name, user.destination_circle.name]
+
+    @staticmethod
+    def user_from_record(record):
+        return User(*record)
+
+    @staticmethod
+    def entry_to_record(entry):
+        amount, kind, car, user, circle = entry
+        return [str(amount), kind, Ledger.get_key(car), Ledger.get_key(user), Ledger.get_key(circle),
+                car.type if car is not None else None]
+
+    @staticmethod
+    def entry_from_record(rent_it_now, record):
+        # The cars of the old entries may have been removed, so a Ledger.Key is enough to rebuild the totals
+        amount, kind, license_plate, driving_license, circle_name, car_type = record
+        car = Ledger.Key(license_plate, car_type) if license_plate is not None else None
+        return Decimal(amount), kind, car, driving_license, circle_name
+
+    def append(self, operation, args):
+        with self.lock:
+            if self.records_since_snapshot >= self.snapshot_every:
+                self.snapshot()
+            self.sequence += 1
+            self.records_since_snapshot += 1
+            self.buffer.append(json.dumps([self.sequence, operation, *args], separators=(",", ":")))
+            if len(self.buffer) >= self.group_size or time.monotonic() - self.last_sync >= self.sync_interval:
+                self.commit()
+            elif self.flush_timer is None:
+                # Without more records the group is committed by the timer, so no record waits more than sync_interval
+                self.flush_timer = threading.Timer(self.sync_interval, self.commit)
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+
+    def commit(self):
+        with self.lock:
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+                self.flush_timer = None
+            if self.file is None:
+                return
+            if self.buffer:
+                self.buffer.append("")
+                self.file.write("\n".join(self.buffer))
+                self.buffer = []
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.last_sync = time.monotonic()
+
+    def snapshot(self):
+        self.commit()
+        rent_it_now = self.rent_it_now
+        # Only the records of the ledger since the last snapshot are written, to the archive
+        with open(os.path.join(self.directory, self.LEDGER_FILE), "a") as file:
+            rent_it_now.ledger.archive(file)
+            file.flush()
+            os.fsync(file.fileno())
+            ledger_size = file.tell()
+        state = {
+            "sequence": self.sequence,
+            "ledger": rent_it_now.ledger.to_state(),
+            "ledger_size": ledger_size,
+            "current_time": rent_it_now.current_time,
+            "cars": [self.car_to_record(car) for car in rent_it_now.iterate_cars()],
+            "users": [self.user_to_record(user) for user in rent_it_now.iterate_users()],
+        }
+        path = os.path.join(self.directory, self.SNAPSHOT_FILE)
+        with open(path + ".tmp", "w") as file:
+            json.dump(state, file, separators=(",", ":"))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + ".tmp", path)
+
+        # Everything in the journal is now in the snapshot
+        self.file.truncate(0)
+        self.file.seek(0)
+        self.records_since_snapshot = 0
+
+    def recover(self, rent_it_now=None):
+        rent_it_now = rent_it_now if rent_it_now is not None else RentItNow()
+
+        snapshot_path = os.path.join(self.directory, self.SNAPSHOT_FILE)
+        ledger_path = os.path.join(self.directory, self.LEDGER_FILE)
+        ledger_size = 0
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path) as file:
+                state = json.load(file)
+            self.load_snapshot(rent_it_now, state)
+            self.sequence = state["sequence"]
+            ledger_size = state["ledger_size"]
+        # The records archived by a snapshot that was not saved are cut off, the journal replays them
+        if os.path.exists(ledger_path) and os.path.getsize(ledger_path) > ledger_size:
+            os.truncate(ledger_path, ledger_size)
+
+        journal_path = os.path.join(self.directory, self.JOURNAL_FILE)
+        if os.path.exists(journal_path):
+            valid_size = 0  # bytes of the complete lines
+            with open(journal_path, "rb") as file:
+                for line in file:
+                    if not line.endswith(b"\n"):
+                        break  # the last line was not written completely
+                    try:
+                        sequence, operation, *args = json.loads(line)
+                    except ValueError:
+                        break
+                    valid_size += len(line)
+                    if sequence > self.sequence:
+                        self.apply(rent_it_now, operation, args)
+                        self.sequence = sequence
+                        self.records_since_snapshot += 1
+            # The partial line is cut off, otherwise the next records would be appended to it and lost at the next recovery
+            if valid_size < os.path.getsize(journal_path):
+                os.truncate(journal_path, valid_size)
+
+        self.rent_it_now = rent_it_now
+        self.file = open(journal_path, "a")
+        rent_it_now.journal = self
+        return rent_it_now
+
+    def load_snapshot(self, rent_it_now, state):
+        for record in state["cars"]:
+            car = self.car_from_record(record)
+            rent_it_now.add_car(car)
+            if car.in_service:
+                rent_it_now.maintenance.restore_service(car)
+            elif not car.availability and car.release_time is not None:
+                rent_it_now.set_release_time(car, car.release_time)
+        for record in state["users"]:
+            rent_it_now.add_user(self.user_from_record(record))
+        rent_it_now.ledger = Ledger.from_state(state["ledger"], os.path.join(self.directory, self.LEDGER_FILE))
+        rent_it_now.current_time = state["current_time"]
+
+    def apply(self, rent_it_now, operation, args):
+        if operation in ("add_car", "update_car"):
+            getattr(rent_it_now, operation)(self.car_from_record(args[0]))
+        elif operation in ("add_user", "update_user"):
+            getattr(rent_it_now, operation)(self.user_from_record(args[0]))
+        elif operation in ("remove_car", "remove_user", "advance_time"):
+            getattr(rent_it_now, operation)(args[0])
+        elif operation == "update_bank_account":
+            rent_it_now.update_bank_account(*self.entry_from_record(rent_it_now, args[0]))
+        elif operation == "update_bank_account_batch":
+            rent_it_now.update_bank_account_batch([self.entry_from_record(rent_it_now, record) for record in args[0]])
+        elif operation == "rent_car":
+            rent_it_now.rent_car(rent_it_now.get_car(args[0]), Circle(args[1]), Circle(args[2]), *args[3:])
+        elif operation == "service":
+            rent_it_now.get_car(args[0]).service(rent_it_now, charge=args[1])
+        elif operation in ("reserve", "make_available"):
+            getattr(rent_it_now.get_car(args[0]), operation)()
+        elif operation == "reposition_car":
+            rent_it_now.reposition_car(rent_it_now.get_car(args[0]), Circle(args[1]))
+        elif operation == "move_to":
+            rent_it_now.get_car(args[0]).move_to(Circle(args[1]) if args[1] is not None else None)
+        else:
+            raise ValueError(f"Invalid journal operation: {operation}")
+
+    def close(self):
+        if self.file is not None:
+            self.commit()
+            self.file.close()
+            self.file = None
+        if self.rent_it_now is not None:
+            self.rent_it_now.journal = None
+
+
+# **SQLiteRentItNow** is a **RentItNow** that keeps cars, users and the history of the rentals in a SQLite database instead of the dictionaries in memory, for fleets and users that don't fit comfortably in RAM. It has the same public methods, so **User**, **FleetSimulator** and the other classes work with it unchanged.
+# 
+# - The tables have indexes on (type, availability), license plate and driving license, so **find_best_car** and the lookups don't scan the tables.
+# - The queries are constant strings, so the prepared statements are reused from the statement cache of each connection.
+# - The connections come from a small pool; the calls made inside an open transaction reuse its connection, so a rental (reserve, distance, release time, history) is written in one transaction. **add_cars** and **remove_cars** write all the cars in one transaction.
+# - **iterate_cars** and **iterate_users** stream the rows from the cursor instead of loading all the table.
+# 
+# Only the cars in use stay in memory (e.g. rented cars, cars in service, or cars referenced by the caller); each car is loaded once while it's in use, so all the changes go to the same object and are written to its row. The km left before the service and the release times are indexed in the table (**SQLiteMaintenanceScheduler**, **get_first_release_time**) instead of the heaps of **RentItNow**, which would keep every car rented once in memory.
+
+class SQLiteRentItNow(RentItNow):
+    CAR_COLUMNS = ("type, license_plate, brand, name, total_distance, next_service_distance, availability, travel_time, "
+                   "serviced, release_time, in_service, circle")
+    USER_COLUMNS = ("name, surname, address, credit_card, driving_license, selected_car_type, num_passengers, start_circle, "
+                    "destination_circle")
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cars (
+            position INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            license_plate TEXT NOT NULL UNIQUE,
+            brand TEXT,
+            name TEXT,
+            total_distance INTEGER NOT NULL,
+            next_service_distance INTEGER NOT NULL,
+            availability INTEGER NOT NULL,
+            travel_time REAL NOT NULL,
+            serviced INTEGER NOT NULL,
+            release_time REAL,
+            in_service INTEGER NOT NULL,
+            circle TEXT
+        );
+        CREATE INDEX IF NOT EXISTS cars_type_availability ON cars (type, availability, circle, position);
+        CREATE INDEX IF NOT EXISTS cars_service_due ON cars (type, next_service_distance - total_distance);
+        CREATE INDEX IF NOT EXISTS cars_release_time ON cars (type, release_time) WHERE availability = 0 AND release_time IS NOT NULL;
+        CREATE TABLE IF NOT EXISTS users (
+            position INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            surname TEXT,
+            address TEXT,
+            credit_card TEXT,
+            driving_license TEXT NOT NULL UNIQUE,
+            selected_car_type TEXT,
+            num_passengers INTEGER,
+            start_circle TEXT,
+            destination_circle TEXT
+        );
+        CREATE TABLE IF NOT EXISTS rentals (
+            id INTEGER PRIMARY KEY,
+            license_plate TEXT NOT NULL,
+            start_circle TEXT NOT NULL,
+            destination_circle TEXT NOT NULL,
+            distance INTEGER NOT NULL,
+            cost INTEGER NOT NULL,
+            start_time REAL NOT NULL,
+            travel_time REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS rentals_license_plate ON rentals (license_plate);
+    """
+
+    def __init__(self, path=":memory:", pool_size=4):
+        super().__init__()
+        uri = False
+        if path == ":memory:":
+            # A named in-memory database, so all the connections of the pool see the same data
+            path, uri = f"file:rentitnow{id(self)}?mode=memory&cache=shared", True
+
+        self.pool = queue.LifoQueue()
+        for _ in range(pool_size):
+            connection = sqlite3.connect(path, uri=uri, check_same_thread=False, cached_statements=256)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.pool.put(connection)
+        self.local = threading.local()
+        self.loaded_cars = weakref.WeakValueDictionary()
+        self.maintenance = SQLiteMaintenanceScheduler(self)
+
+        with self.connection() as connection:
+            connection.executescript(self.SCHEMA)
+            # The counters of the cars already in the database are loaded once, then kept up to date like in RentItNow
+            for row in connection.execute("SELECT type, COUNT(*), SUM(availability), SUM(in_service), SUM(serviced), "
+                                          "SUM(total_distance), circle FROM cars GROUP BY type, circle"):
+                self.update_fleet_counters(*row[:6], circle=self.circles.get(row[6]))
+
+    @contextlib.contextmanager
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            yield connection
+            return
+
+        connection = self.pool.get()
+        self.local.connection = connection
+        try:
+            with connection:
+                yield connection
+        finally:
+            self.local.connection = None
+            self.pool.put(connection)
+
+    def close(self):
+        while not self.pool.empty():
+            self.pool.get().close()
+
+    def car_from_row(self, row):
+        car = self.loaded_cars.get(row[1])
+        if car is None:
+            car = Journal.car_from_record(list(row[:12]))
+            car.availability, car.serviced, car.in_service = bool(car.availability), bool(car.serviced), bool(car.in_service)
+            car.rent_it_now = self
+            car.position = row[12]
+            # The row is already in the counters, loaded with the database
+            car.counted_state, car.counted_distance = self.get_counted_state(car), car.total_distance
+            self.loaded_cars[car.license_plate] = car
+        return car
+
+    def save_car(self, car):
+        if car.rent_it_now is not self:
+            return
+        with self.connection() as connection:
+            connection.execute(
+                "UPDATE cars SET total_distance = ?, next_service_distance = ?, availability = ?, travel_time = ?, "
+                "serviced = ?, release_time = ?, in_service = ?, circle = ? WHERE license_plate = ?",
+                (car.total_distance, car.next_service_distance, car.availability, car.travel_time, car.serviced,
+                 car.release_time, car.in_service, car.circle.name if car.circle is not None else None, car.license_plate))
+
+    def iterate_cars(self):
+        with self.connection() as connection:
+            for row in connection.execute(f"SELECT {self.CAR_COLUMNS}, position FROM cars ORDER BY position"):
+                yield self.car_from_row(row)
+
+    def get_car(self, license_plate):
+        with self.connection() as connection:
+            row = connection.execute(f"SELECT {self.CAR_COLUMNS}, position FROM cars WHERE license_plate = ?",
+                                     (license_plate,)).fetchone()
+        return self.car_from_row(row) if row else None
+
+    def get_last_saved_car_by_type(self, car_type: str):
+        with self.connection() as connection:
+            row = connection.execute(f"SELECT {self.CAR_COLUMNS}, position FROM cars WHERE type = ? ORDER BY position DESC LIMIT 1",
+                                     (car_type,)).fetchone()
+        return self.car_from_row(row) if row else None
+
+    def add_car(self, car):
+        with self.connection() as connection:
+            if connection.execute("SELECT 1 FROM cars WHERE license_plate = ?", (car.license_plate,)).fetchone():
+                self.update_car(car)
+                return
+            cursor = connection.execute(f"INSERT INTO cars ({self.CAR_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                        Journal.car_to_record(car))
+        car.rent_it_now = self
+        car.position = cursor.lastrowid
+        self.loaded_cars[car.license_plate] = car
+        with self.get_type_lock(car.type):
+            self.count_car(car)
+            if car.next_service_distance <= car.total_distance:
+                self.car_distance_changed(car)
+
+    def add_cars(self, cars):
+        with self.connection():
+            for car in cars:
+                self.add_car(car)
+
+    def update_car(self, car):
+        with self.connection() as connection:
+            row = connection.execute("SELECT position, type, availability, in_service, serviced, total_distance, circle "
+                                     "FROM cars WHERE license_plate = ?", (car.license_plate,)).fetchone()
+            if row is None:
+                return
+            with self.get_type_lock(row[1]):
+                self.update_fleet_counters(row[1], -1, -row[2], -row[3], -row[4], -row[5], self.circles.get(row[6]))
+            connection.execute(f"UPDATE cars SET ({self.CAR_COLUMNS}) = (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) WHERE license_plate = ?",
+                               Journal.car_to_record(car) + [car.license_plate])
+        old_car = self.loaded_cars.get(car.license_plate)
+        if old_car is not None and old_car is not car:
+            old_car.rent_it_now = None
+            with self.get_type_lock(old_car.type):
+                self.maintenance.car_removed(old_car)
+        car.rent_it_now = self
+        car.position = row[0]
+        self.loaded_cars[car.license_plate] = car
+        with self.get_type_lock(car.type):
+            self.count_car(car)
+            if car.in_service and old_car is not car and car.release_time is not None:
+                self.maintenance.restore_service(car)
+            self.car_availability_changed(car)
+            self.car_distance_changed(car)
+
+    def remove_car(self, license_plate):
+        self.remove_cars([license_plate])
+
+    def remove_cars(self, license_plates):
+        license_plates = list(license_plates)
+        with self.connection() as connection:
+            for license_plate in license_plates:
+                # SELECT then DELETE in the same transaction, because DELETE ... RETURNING needs SQLite 3.35
+                row = connection.execute("SELECT type, availability, in_service, serviced, total_distance, circle FROM cars "
+                                         "WHERE license_plate = ?", (license_plate,)).fetchone()
+                if row is not None:
+                    connection.execute("DELETE FROM cars WHERE license_plate = ?", (license_plate,))
+                    with self.get_type_lock(row[0]):
+                        self.update_fleet_counters(row[0], -1, -row[1], -row[2], -row[3], -row[4], self.circles.get(row[5]))
+        for license_plate in license_plates:
+            car = self.loaded_cars.pop(license_plate, None)
+            if car is not None:
+                car.rent_it_now = None
+                with self.get_type_lock(car.type):
+                    self.maintenance.car_removed(car)
+
+    def car_availability_changed(self, car):
+        self.save_car(car)
+        if car.availability:
+            self.maintenance.car_available(car)
+
+    def car_distance_changed(self, car):
+        self.save_car(car)
+        super().car_distance_changed(car)
+
+    def set_release_time(self, car, release_time):
+        # The release times are read from the index of the table, so the rented cars are not kept in a heap
+        car.release_time = release_time
+        self.save_car(car)
+
+    def get_first_release_time(self, car_type: str):
+        with self.connection() as connection:
+            return connection.execute("SELECT MIN(release_time) FROM cars WHERE type = ? AND availability = 0 "
+                                      "AND release_time IS NOT NULL", (car_type,)).fetchone()[0]
+
+    def rent_car(self, car, start_circle, destination_circle, price_type=None):
+        with self.connection() as connection:
+            travel_time, cost = super().rent_car(car, start_circle, destination_circle, price_type)
+            connection.execute(
+                "INSERT INTO rentals (license_plate, start_circle, destination_circle, distance, cost, start_time, travel_time) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (car.license_plate, start_circle.name, destination_circle.name, start_circle.distance_to(destination_circle),
+                 cost, self.current_time, travel_time))
+        return travel_time, cost
+
+    def iterate_rentals(self):
+        with self.connection() as connection:
+            yield from connection.execute("SELECT license_plate, start_circle, destination_circle, distance, cost, start_time, "
+                                          "travel_time FROM rentals ORDER BY id")
+
+    def find_best_car(self, car_type: str, num_passengers: int, start_circle, destination_circle):
+        for matching_type in self.get_matching_types(car_type, num_passengers):
+            car = self.take_best_car(matching_type, start_circle)
+            if car is not None:
+                return car
+        return None
+
+    def take_best_car(self, car_type: str, start_circle=None):
+        # The first available car of every circle comes from the index, then the nearest one is chosen like in RentItNow
+        best_key = best_row = None
+        with self.connection() as connection:
+            for circle_name in Circle.NAMES + [None]:
+                circle = Circle(circle_name) if circle_name is not None else None
+                if self.max_pickup_distance is not None and self.get_pickup_distance(circle, start_circle) > self.max_pickup_distance:
+                    continue
+                row = connection.execute(f"SELECT {self.CAR_COLUMNS}, position FROM cars WHERE type = ? AND availability = 1 "
+                                         "AND circle IS ? ORDER BY position LIMIT 1", (car_type, circle_name)).fetchone()
+                if row is None:
+                    continue
+                key = (self.get_pickup_distance(circle, start_circle), row[12])
+                if best_key is None or key < best_key:
+                    best_key, best_row = key, row
+        return self.car_from_row(best_row) if best_row else None
+
+    def user_from_row(self, row):
+        return User(*row)
+
+    def iterate_users(self):
+        with self.connection() as connection:
+            for row in connection.execute(f"SELECT {self.USER_COLUMNS} FROM users ORDER BY position"):
+                yield self.user_from_row(row)
+
+    def get_user(self, driving_license):
+        with self.connection() as connection:
+            row = connection.execute(f"SELECT {self.USER_COLUMNS} FROM users WHERE driving_license = ?",
+                                     (driving_license,)).fetchone()
+        return self.user_from_row(row) if row else None
+
+    def add_user(self, user):
+        with self.connection() as connection:
+            connection.execute(f"INSERT INTO users ({self.USER_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                               "ON CONFLICT (driving_license) DO UPDATE SET (name, surname, address, credit_card, "
+                               "selected_car_type, num_passengers, start_circle, destination_circle) = (excluded.name, "
+                               "excluded.surname, excluded.address, excluded.credit_card, excluded.selected_car_type, "
+                               "excluded.num_passengers, excluded.start_circle, excluded.destination_circle)",
+                               Journal.user_to_record(user))
+
+    def add_users(self, users):
+        with self.connection():
+            for user in users:
+                self.add_user(user)
+
+    def update_user(self, user):
+        with self.connection() as connection:
+            connection.execute(f"UPDATE users SET ({self.USER_COLUMNS}) = (?, ?, ?, ?, ?, ?, ?, ?, ?) WHERE driving_license = ?",
+                               Journal.user_to_record(user) + [user.driving_license])
+
+    def remove_user(self, driving_license):
+        with self.connection() as connection:
+            connection.execute("DELETE FROM users WHERE driving_license = ?", (driving_license,))
+
+
+class SQLiteMaintenanceScheduler(MaintenanceScheduler):
+    # The km left before the service come from the cars_service_due index, so no car is kept in memory for them;
+    # only the due cars and the cars in service are
+    def distance_changed(self, car):
+        if car.next_service_distance - car.total_distance <= 0 and not car.in_service:
+            self.due_cars.setdefault(car.type, {})[car.license_plate] = car
+            self.service_due_cars(car.type)
+
+    def cars_added(self, car_type, cars):
+        for car in cars:
+            self.distance_changed(car)
+
+    def cars_due_within(self, distance, car_type=None):
+        rent_it_now = self.rent_it_now
+        car_types = [car_type] if car_type else list(rent_it_now.fleet_counters)
+        due_cars = []
+        with rent_it_now.connection() as connection:
+            for car_type in car_types:
+                rows = connection.execute(f"SELECT {rent_it_now.CAR_COLUMNS}, position FROM cars WHERE type = ? AND "
+                                          "next_service_distance - total_distance <= ?", (car_type, distance)).fetchall()
+                due_cars.extend(rent_it_now.car_from_row(row) for row in rows)
+        return sorted(due_cars, key=lambda car: car.next_service_distance - car.total_distance)
+
+
+# **RentItNowService** is a long running local service built on asyncio. Clients connect with TCP and send one JSON object per line, e.g. {"op": "request_trip", "driving_license": "DL123456"}; the service answers each line with one JSON line. The operations are:
+# - **add_user**, **update_user** (with a "user" object), **remove_user** (with "driving_license"),
+# - **add_car**, **update_car** (with a "car" object), **remove_car** (with "license_plate"),
+# - **request_trip** for a registered user, with the car type, passengers and circles of the user or the ones in the request,
+# - **return_car** at the end of the trip (with "license_plate"),
+# - **fleet_status**, with the cars available per type and the bank account.
+# 
+# The trip requests that arrive within **batch_window** seconds are collected and sent together to **reserve_batch**, so the state of the fleet is visited once per micro-batch instead of once per request.
+
+class RentItNowService:
+    def __init__(self, rent_it_now: RentItNow, batch_window=0.002, max_batch_size=512):
+        self.rent_it_now = rent_it_now
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.pending_trips = []  # (request, future)
+        self.flush_handle = None
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self.handle_client, host, port, limit=2 ** 20)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    response = await self.handle_message(json.loads(line))
+                except Exception as error:
+                    response = {"ok": False, "error": str(error)}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle_message(self, message):
+        op = message.get("op")
+        rent_it_now = self.rent_it_now
+        if op == "request_trip":
+            return await self.request_trip(message)
+        elif op == "return_car":
+            car = rent_it_now.get_car(message["license_plate"])
+            if car is None:
+                raise ValueError(f"Invalid license plate: {message['license_plate']}")
+            car.make_available()
+        elif op in ("add_user", "update_user"):
+            getattr(rent_it_now, op)(User(**message["user"]))
+        elif op == "remove_user":
+            rent_it_now.remove_user(message["driving_license"])
+        elif op in ("add_car", "update_car"):
+            car = message["car"]
+            getattr(rent_it_now, op)(Car(car["type"], car["license_plate"], car["brand"], car["name"]))
+        elif op == "remove_car":
+            rent_it_now.remove_car(message["license_plate"])
+        elif op == "fleet_status":
+            return {"ok": True, **self.get_fleet_status()}
+        else:
+            raise ValueError(f"Invalid operation: {op}")
+        return {"ok": True}
+
+    def get_fleet_status(self):
+        # Read from the fleet counters, so the event loop doesn't stop on a scan of the fleet
+        summary = self.rent_it_now.fleet_summary()
+        return {"cars": {car_type: counters["cars"] for car_type, counters in summary["types"].items()},
+                "available": {car_type: counters["available"] for car_type, counters in summary["types"].items()},
+                "bank_account": str(summary["bank_account"])}
+
+    def request_trip(self, message):
+        user = self.rent_it_now.get_user(message["driving_license"])
+        if user is None:
+            raise ValueError(f"Invalid driving license: {message['driving_license']}")
+        car_type = message.get("car_type", user.selected_car_type)
+        if car_type not in Car.TYPE_CAPACITIES:
+            raise ValueError(f"Invalid car type: {car_type}")
+        # Circle raises ValueError for an unknown circle, so a bad request is answered before joining a batch
+        request = (
+            user,
+            car_type,
+            message.get("num_passengers", user.num_passengers),
+            Circle(message["start_circle"]) if "start_circle" in message else user.start_circle,
+            Circle(message["destination_circle"]) if "destination_circle" in message else user.destination_circle,
+        )
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending_trips.append((request, future))
+        if len(self.pending_trips) >= self.max_batch_size:
+            self.flush_trips()
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self.flush_trips)
+        return future
+
+    def flush_trips(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        pending_trips, self.pending_trips = self.pending_trips, []
+        if not pending_trips:
+            return
+
+        try:
+            results = self.rent_it_now.reserve_batch([request for request, _ in pending_trips])
+        except Exception as error:
+            # flush_trips runs from the event loop, so the error goes to the waiting requests or nobody would see it
+            for _, future in pending_trips:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, future), result in zip(pending_trips, results):
+            if future.done():
+                continue
+            if result["car"] is None:
+                future.set_result({"ok": True, "reserved": False, "waiting_time": result["waiting_time"]})
+            else:
+                future.set_result({"ok": True, "reserved": True, "license_plate": result["car"].license_plate,
+                                   "travel_time": result["travel_time"], "cost": result["cost"]})
+
+
+# **ShardedRentItNow** spreads the fleet over several worker processes, so the reservations are not limited to one CPU core by the GIL. Every worker process (a **FleetShard**) has its own **RentItNow** with a part of the cars: the shards are split between the car types, and when there are more shards than car types the cars of a type are split between its shards by license plate.
+# 
+# The router in the main process keeps the users and sends each request to the shards owning the car type. The messages go through a pipe per shard and the requests are sent in batches (**reserve_batch**), so the cost of the communication is paid once per batch and not once per request; all the shards work on their part of a batch at the same time. The bank account and the fleet status are computed asking every shard and adding the answers (scatter-gather). The cars stay in the worker processes, so the router answers with license plates instead of **Car** objects. An error in a shard is sent back with the answer and raised again by the router, and the shard keeps serving.
+
+class FleetShard:
+    def __init__(self):
+        self.rent_it_now = RentItNow()
+
+    def serve(self, connection):
+        while True:
+            message = connection.recv()
+            if message is None:
+                break
+            operation, args = message
+            # An error is sent back to the router instead of ending the worker, so the shard keeps serving
+            try:
+                connection.send((True, getattr(self, operation)(*args)))
+            except Exception as error:
+                try:
+                    connection.send((False, error))
+                except Exception:
+                    # Some errors can't be pickled
+                    connection.send((False, RuntimeError(repr(error))))
+
+    def add_cars(self, records):
+        self.rent_it_now.add_cars(Journal.car_from_record(record) for record in records)
+
+    def remove_cars(self, license_plates):
+        self.rent_it_now.remove_cars(license_plates)
+
+    def make_available(self, license_plates):
+        for license_plate in license_plates:
+            car = self.rent_it_now.get_car(license_plate)
+            if car is not None:
+                car.make_available()
+
+    def find_best_car(self, car_type, start_circle=None):
+        car = self.rent_it_now.find_best_car(car_type, 1, Circle(start_circle) if start_circle else None, None)
+        return car.license_plate if car else None
+
+    def reserve_batch(self, requests):
+        requests = [(driving_license, car_type, num_passengers, Circle(start_circle), Circle(destination_circle))
+                    for driving_license, car_type, num_passengers, start_circle, destination_circle in requests]
+        return [(result["car"].license_plate, result["travel_time"], result["cost"]) if result["car"] else (None, result["waiting_time"], 0)
+                for result in self.rent_it_now.reserve_batch(requests)]
+
+    def advance_time(self, now):
+        self.rent_it_now.advance_time(now)
+
+    def get_bank_account(self):
+        return self.rent_it_now.get_bank_account()
+
+    def count_cars(self):
+        counts = {}
+        for car in self.rent_it_now.iterate_cars():
+            total, available = counts.get(car.type, (0, 0))
+            counts[car.type] = (total + 1, available + car.availability)
+        return counts
+
+
+def run_fleet_shard(connection):
+    FleetShard().serve(connection)
+
+
+class ShardedRentItNow:
+    def __init__(self, num_shards):
+        self.num_shards = num_shards
+        self.connections = []
+        self.processes = []
+        for _ in range(num_shards):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=run_fleet_shard, args=(worker_connection,), daemon=True)
+            process.start()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+        car_types = list(Car.TYPE_PRICES)
+        if num_shards >= len(car_types):
+            self.shards_by_type = {car_type: list(range(idx, num_shards, len(car_types))) for idx, car_type in enumerate(car_types)}
+        else:
+            self.shards_by_type = {car_type: [idx % num_shards] for idx, car_type in enumerate(car_types)}
+        self.car_shards = {}  # license plate -> shard
+        self.users = {}
+        self.circles = {name: Circle(name) for name in Circle.NAMES}
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(None)
+        for process in self.processes:
+            process.join()
+
+    @staticmethod
+    def get_answer(answer):
+        ok, value = answer
+        if not ok:
+            raise value
+        return value
+
+    def call(self, shard, operation, *args):
+        self.connections[shard].send((operation, args))
+        return self.get_answer(self.connections[shard].recv())
+
+    def scatter(self, operation, args_by_shard):
+        # Sends all the messages before waiting for the answers, so the shards work at the same time; all the answers
+        # are read before raising an error, so the next call doesn't get the answer of this one
+        for shard, args in args_by_shard.items():
+            self.connections[shard].send((operation, args))
+        answers = {shard: self.connections[shard].recv() for shard in args_by_shard}
+        return {shard: self.get_answer(answer) for shard, answer in answers.items()}
+
+    def get_shard(self, car_type, license_plate):
+        shards = self.shards_by_type.get(car_type)
+        if shards is None:
+            raise ValueError(f"Invalid car type: {car_type}")
+        return shards[zlib.crc32(license_plate.encode()) % len(shards)]
+
+    def add_cars(self, cars):
+        records_by_shard = {}
+        for car in cars:
+            shard = self.get_shard(car.type, car.license_plate)
+            self.car_shards[car.license_plate] = shard
+            records_by_shard.setdefault(shard, []).append(Journal.car_to_record(car))
+        self.scatter("add_cars", {shard: (records,) for shard, records in records_by_shard.items()})
+
+    def add_car(self, car):
+        self.add_cars([car])
+
+    def update_car(self, car):
+        if car.license_plate in self.car_shards:
+            self.remove_car(car.license_plate)
+            self.add_car(car)
+
+    def remove_cars(self, license_plates):
+        plates_by_shard = {}
+        for license_plate in license_plates:
+            shard = self.car_shards.pop(license_plate, None)
+            if shard is not None:
+                plates_by_shard.setdefault(shard, []).append(license_plate)
+        self.scatter("remove_cars", {shard: (plates,) for shard, plates in plates_by_shard.items()})
+
+    def remove_car(self, license_plate):
+        self.remove_cars([license_plate])
+
+    def return_cars(self, license_plates):
+        plates_by_shard = {}
+        for license_plate in license_plates:
+            plates_by_shard.setdefault(self.car_shards[license_plate], []).append(license_plate)
+        self.scatter("make_available", {shard: (plates,) for shard, plates in plates_by_shard.items()})
+
+    def iterate_users(self):
+        yield from self.users.values()
+
+    def get_user(self, driving_license):
+        return self.users.get(driving_license)
+
+    def add_user(self, user):
+        self.users[user.driving_license] = user
+
+    def update_user(self, user):
+        if user.driving_license in self.users:
+            self.users[user.driving_license] = user
+
+    def remove_user(self, driving_license):
+        self.users.pop(driving_license, None)
+
+    def find_best_car(self, car_type: str, num_passengers: int, start_circle, destination_circle):
+        for shard in self.shards_by_type.get(car_type, []):
+            license_plate = self.call(shard, "find_best_car", car_type,
+                                      start_circle if isinstance(start_circle, str) or start_circle is None else start_circle.name)
+            if license_plate is not None:
+                return license_plate
+        return None
+
+    def reserve_batch(self, requests):
+        # The requests are checked before sending them, so a bad request doesn't leave the batch done by some shards only
+        for _, car_type, _, start_circle, destination_circle in requests:
+            if car_type not in self.shards_by_type:
+                raise ValueError(f"Invalid car type: {car_type}")
+            for circle in (start_circle, destination_circle):
+                if isinstance(circle, str):
+                    Circle(circle)
+
+        results = [None] * len(requests)
+        # Every request is sent first to one of the shards of its type, and then to the next ones if that shard has no car
+        pending = list(range(len(requests)))
+        for attempt in range(max(len(shards) for shards in self.shards_by_type.values())):
+            requests_by_shard = {}
+            for idx in pending:
+                user, car_type, num_passengers, start_circle, destination_circle = requests[idx]
+                shards = self.shards_by_type[car_type]
+                if attempt >= len(shards):
+                    continue
+                start_circle = start_circle if isinstance(start_circle, str) else start_circle.name
+                destination_circle = destination_circle if isinstance(destination_circle, str) else destination_circle.name
+                request = (user.driving_license, car_type, num_passengers, start_circle, destination_circle)
+                requests_by_shard.setdefault(shards[(idx + attempt) % len(shards)], []).append((idx, request))
+
+            answers = self.scatter("reserve_batch", {shard: ([request for _, request in shard_requests],)
+                                                     for shard, shard_requests in requests_by_shard.items()})
+            pending = []
+            for shard, shard_requests in requests_by_shard.items():
+                for (idx, _), (license_plate, time_value, cost) in zip(shard_requests, answers[shard]):
+                    user = requests[idx][0]
+                    if license_plate is not None:
+                        results[idx] = {"user": user, "car": license_plate, "travel_time": time_value, "cost": cost}
+                        continue
+                    # The waiting time is the shortest one among the shards asked so far
+                    previous = results[idx]["waiting_time"] if results[idx] else None
+                    waiting_times = [value for value in (time_value, previous) if value is not None]
+                    results[idx] = {"user": user, "car": None, "waiting_time": min(waiting_times) if waiting_times else None}
+                    pending.append(idx)
+            if not pending:
+                break
+        return results
+
+    def advance_time(self, now):
+        self.scatter("advance_time", {shard: (now,) for shard in range(self.num_shards)})
+
+    def get_bank_account(self):
+        return sum(self.scatter("get_bank_account", {shard: () for shard in range(self.num_shards)}).values())
+
+    def count_cars(self):
+        counts = {car_type: (0, 0) for car_type in Car.TYPE_PRICES}
+        for shard_counts in self.scatter("count_cars", {shard: () for shard in range(self.num_shards)}).values():
+            for car_type, (total, available) in shard_counts.items():
+                counts[car_type] = (counts[car_type][0] + total, counts[car_type][1] + available)
+        return counts
+
+
+# **BenchmarkSuite** measures the main operations of **RentItNow** on synthetic fleets, from a hundred cars to the whole national fleet (10^6 cars).
+# 
+# **generate_fleet** builds a fleet with more ECO than DELUXE cars and a random distance already driven, and **generate_users** builds the trip requests with mixed car types, number of passengers and pairs of circles; the same seed always gives the same fleet and requests. For every fleet size **run** measures **find_best_car**, **User.reserve_car**, the service of the cars (a trip that makes the car due, and the release one day later), **update_car**, **remove_user** and **remove_car**, and reports the throughput, the p50 and p99 latency in microseconds and the peak memory of loading the fleet.
+# 
+# The results are saved as JSON with **save_results**, and **compare_results** lists the measures of a run that got worse than the baseline run by more than the tolerance, so a regression shows up before it is merged.
+
+class BenchmarkSuite:
+    TYPE_WEIGHTS = {"ECO": 5, "MID-CLASS": 3, "DELUXE": 2}
+    PASSENGER_WEIGHTS = {1: 4, 2: 3, 3: 2, 4: 1}
+    OPERATIONS = ["find_best_car", "reserve_car", "service", "update_car", "remove_user", "remove_car"]
+
+    def __init__(self, fleet_sizes=(100, 1_000, 10_000, 100_000, 1_000_000), num_operations=2_000, seed=0):
+        self.fleet_sizes = list(fleet_sizes)
+        self.num_operations = num_operations
+        self.seed = seed
+
+    @classmethod
+    def generate_fleet(cls, num_cars, seed=0):
+        rng = random.Random(seed)
+        car_types = rng.choices(list(cls.TYPE_WEIGHTS), weights=list(cls.TYPE_WEIGHTS.values()), k=num_cars)
+        cars = []
+        for i, car_type in enumerate(car_types):
+            car = Car(car_type, f"{car_type[:3]}{i:07d}", "Fiat", "Panda")
+            car.total_distance = rng.randrange(0, 1500, 5)
+            cars.append(car)
+        return cars
+
+    @classmethod
+    def generate_users(cls, num_users, seed=0):
+        rng = random.Random(seed + 1)
+        car_types = rng.choices(list(cls.TYPE_WEIGHTS), weights=list(cls.TYPE_WEIGHTS.values()), k=num_users)
+        passengers = rng.choices(list(cls.PASSENGER_WEIGHTS), weights=list(cls.PASSENGER_WEIGHTS.values()), k=num_users)
+        return [User("Bench", "User", "1 Test St", "0000-0000-0000-0000", f"DL{i:07d}", car_types[i],
+                     min(passengers[i], Car.TYPE_CAPACITIES[car_types[i]]),
+                     rng.choice(Circle.NAMES), rng.choice(Circle.NAMES)) for i in range(num_users)]
+
+    @staticmethod
+    def measure(operation, items):
+        latencies = []
+        for item in items:
+            start = time.perf_counter_ns()
+            operation(item)
+            latencies.append(time.perf_counter_ns() - start)
+        if not latencies:
+            return None
+        latencies.sort()
+        total = sum(latencies) or 1
+        return {
+            "count": len(latencies),
+            "throughput": len(latencies) * 1e9 / total,
+            "p50_us": latencies[len(latencies) // 2] / 1000,
+            "p99_us": latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] / 1000,
+        }
+
+    def run_fleet(self, fleet_size):
+        # The peak memory is measured on its own, tracemalloc would slow down the timed operations
+        tracemalloc.start()
+        rent_it_now = RentItNow()
+        rent_it_now.add_cars(self.generate_fleet(fleet_size, self.seed))
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del rent_it_now
+
+        rent_it_now = RentItNow()
+        cars = self.generate_fleet(fleet_size, self.seed)
+        rent_it_now.add_cars(cars)
+        users = self.generate_users(self.num_operations, self.seed)
+        for user in users:
+            rent_it_now.add_user(user)
+
+        rng = random.Random(self.seed + 2)
+        sample = rng.sample(cars, min(fleet_size, self.num_operations))
+        results = {"peak_memory_mb": peak_memory / 2 ** 20}
+
+        results["find_best_car"] = self.measure(
+            lambda user: rent_it_now.find_best_car(user.selected_car_type, user.num_passengers, user.start_circle, user.destination_circle), users)
+        results["reserve_car"] = self.measure(lambda user: user.reserve_car(rent_it_now), users)
+
+        def service(car):
+            car.set_total_distance(car.next_service_distance - car.total_distance, rent_it_now)
+        results["service"] = self.measure(service, sample)
+        release_time = rent_it_now.current_time + rent_it_now.SERVICE_DURATION + 24
+        results["service_release"] = self.measure(rent_it_now.advance_time, [release_time])
+
+        results["update_car"] = self.measure(
+            lambda car: rent_it_now.update_car(Car(car.type, car.license_plate, "Fiat", "Tipo")), sample)
+        results["remove_user"] = self.measure(rent_it_now.remove_user, [user.driving_license for user in users])
+        results["remove_car"] = self.measure(rent_it_now.remove_car, [car.license_plate for car in sample])
+        return results
+
+    def run(self):
+        return {
+            "python": platform.python_version(),
+            "seed": self.seed,
+            "num_operations": self.num_operations,
+            "fleets": {str(fleet_size): self.run_fleet(fleet_size) for fleet_size in self.fleet_sizes},
+        }
+
+    @staticmethod
+    def save_results(results, path):
+        with open(path, "w") as file:
+            json.dump(results, file, indent=2)
+
+    @staticmethod
+    def load_results(path):
+        with open(path) as file:
+            return json.load(file)
+
+    @staticmethod
+    def compare_results(baseline, current, tolerance=0.10):
+        # Lower throughput, or higher latency and memory, by more than the tolerance
+        regressions = []
+        for fleet_size, operations in current["fleets"].items():
+            baseline_operations = baseline["fleets"].get(fleet_size)
+            if baseline_operations is None:
+                continue
+            for operation, result in operations.items():
+                old = baseline_operations.get(operation)
+                if old is None or result is None:
+                    continue
+                if operation == "peak_memory_mb":
+                    measures = [("peak_memory_mb", old, result, False)]
+                else:
+                    measures = [("throughput", old["throughput"], result["throughput"], True),
+                                ("p50_us", old["p50_us"], result["p50_us"], False),
+                                ("p99_us", old["p99_us"], result["p99_us"], False)]
+                for measure, old_value, new_value, higher_is_better in measures:
+                    if old_value == 0:
+                        continue
+                    change = (new_value - old_value) / old_value
+                    if (-change if higher_is_better else change) > tolerance:
+                        regressions.append(f"{fleet_size} cars, {operation} {measure}: {old_value:.2f} -> {new_value:.2f} ({change:+.0%})")
+        return regressions
+
+
+# **FleetIO** loads and saves the cars and the users (with the car type, passengers and circles of their trip) as CSV or JSONL files, with one car or user per line.
+# 
+# **read_cars** and **read_users** are generators: they read the file one line at a time and check the car types against **Car.TYPE_PRICES** and the circles against **RentItNow.circles**, raising a **ValueError** with the line number of the first invalid row. **import_cars** and **import_users** add them in batches with **add_cars** and **add_users** (one transaction per batch on SQLite), so only one batch is in memory at a time. **export_cars** and **export_users** write the rows straight from **iterate_cars** and **iterate_users**.
+
+class FleetIO:
+    CAR_FIELDS = ["type", "license_plate", "brand", "name", "total_distance", "next_service_distance", "circle"]
+    USER_FIELDS = ["name", "surname", "address", "credit_card", "driving_license", "selected_car_type", "num_passengers",
+                   "start_circle", "destination_circle"]
+
+    def __init__(self, rent_it_now: RentItNow, batch_size=10_000):
+        self.rent_it_now = rent_it_now
+        self.batch_size = batch_size
+
+    @staticmethod
+    def read_rows(file, fields, format):
+        # Missing values are None in JSONL and empty strings in CSV
+        if format == "csv":
+            reader = csv.reader(file)
+            header = next(reader, None)
+            if header is None:
+                return
+            # The columns missing from the header are read from an empty value added at the end of every row
+            width = len(header)
+            get_values = operator.itemgetter(*[header.index(field) if field in header else width for field in fields])
+            padding = [""] * (width + 1)
+            for line_number, row in enumerate(reader, 2):
+                if row:
+                    yield line_number, get_values(row[:width] + padding[min(len(row), width):])
+        elif format == "jsonl":
+            for line_number, line in enumerate(file, 1):
+                if line.strip():
+                    record = json.loads(line)
+                    yield line_number, [record.get(field) for field in fields]
+        else:
+            raise ValueError(f"Invalid file format: {format}")
+
+    def get_circle(self, name, line_number):
+        circle = self.rent_it_now.circles.get(name)
+        if circle is None:
+            raise ValueError(f"Invalid circle at line {line_number}: {name}")
+        return circle
+
+    def read_cars(self, file, format="csv"):
+        for line_number, (car_type, license_plate, brand, name, total_distance, next_service_distance, circle) in \
+                self.read_rows(file, self.CAR_FIELDS, format):
+            if car_type not in Car.TYPE_PRICES:
+                raise ValueError(f"Invalid car type at line {line_number}: {car_type}")
+            if not license_plate:
+                raise ValueError(f"Missing license plate at line {line_number}")
+            car = Car(car_type, license_plate, brand, name, self.get_circle(circle, line_number) if circle else None)
+            if total_distance:
+                car.total_distance = int(total_distance)
+            if next_service_distance:
+                car.next_service_distance = int(next_service_distance)
+            yield car
+
+    def read_users(self, file, format="csv"):
+        for line_number, (name, surname, address, credit_card, driving_license, selected_car_type, num_passengers,
+                          start_circle, destination_circle) in self.read_rows(file, self.USER_FIELDS, format):
+            if selected_car_type not in Car.TYPE_PRICES:
+                raise ValueError(f"Invalid car type at line {line_number}: {selected_car_type}")
+            if not driving_license:
+                raise ValueError(f"Missing driving license at line {line_number}")
+            yield User(name, surname, address, credit_card, driving_license, selected_car_type, int(num_passengers or 1),
+                       self.get_circle(start_circle, line_number).name, self.get_circle(destination_circle, line_number).name)
+
+    def add_in_batches(self, items, add):
+        # The garbage collector would scan the whole growing fleet again and again while millions of objects are created,
+        # and an import leaves no garbage to collect, so it's paused until the end
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            count = 0
+            while True:
+                batch = list(itertools.islice(items, self.batch_size))
+                if not batch:
+                    return count
+                add(batch)
+                count += len(batch)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def import_cars(self, file, format="csv"):
+        return self.add_in_batches(self.read_cars(file, format), self.rent_it_now.add_cars)
+
+    def import_users(self, file, format="csv"):
+        return self.add_in_batches(self.read_users(file, format), self.rent_it_now.add_users)
+
+    @staticmethod
+    def write_rows(file, fields, rows, format):
+        if format == "csv":
+            writer = csv.writer(file)
+            writer.writerow(fields)
+            writer.writerows(rows)
+        elif format == "jsonl":
+            file.writelines(json.dumps(dict(zip(fields, row))) + "\n" for row in rows)
+        else:
+            raise ValueError(f"Invalid file format: {format}")
+
+    def export_cars(self, file, format="csv"):
+        rows = ((car.type, car.license_plate, car.brand, car.name, car.total_distance, car.next_service_distance,
+                 car.circle.name if car.circle is not None else None) for car in self.rent_it_now.iterate_cars())
+        self.write_rows(file, self.CAR_FIELDS, rows, format)
+
+    def export_users(self, file, format="csv"):
+        rows = ((user.name, user.surname, user.address, user.credit_card, user.driving_license, user.selected_car_type,
+                 user.num_passengers, user.start_circle.name, user.destination_circle.name) for user in self.rent_it_now.iterate_users())
+        self.write_rows(file, self.USER_FIELDS, rows, format)
+
+
+# **DemandStats** keeps the trip requests of the last hours (**window_hours**) per car type and circle: the requests starting in each circle, the ones that found no car, and the cars arriving at each circle at the end of a trip. The counts are kept in buckets of one hour; the total of the window is updated at every request, and a bucket older than the window is subtracted when a new one starts.
+# 
+# **FleetRebalancer** moves the available cars towards the circles where they are requested. For every car type it splits the available cars between the circles in proportion to the requests of the window, and finds the moves with the lowest total km from the circles with too many cars to the ones with too few (a small transportation problem, solved with successive shortest paths on the distances of **Circle.distance_to**). **rebalance** plans and makes the moves with **RentItNow.reposition_car**.
+# 
+# **evaluate_rebalancing** replays the same trace of requests with and without rebalancing every **rebalance_every** hours, and reports the requests answered with a waiting time, the hours the cars were not on a trip, and the km driven to reposition the cars.
+
+class DemandStats:
+    def __init__(self, window_hours=24, bucket_hours=1):
+        self.bucket_hours = bucket_hours
+        self.num_buckets = max(1, round(window_hours / bucket_hours))
+        self.buckets = deque()  # (bucket index, {(kind, car type, circle name): count})
+        self.totals = {}  # (kind, car type, circle name) -> count in the window
+
+    def record(self, time, car_type, start_circle, destination_circle, served):
+        bucket = int(time // self.bucket_hours)
+        if not self.buckets or self.buckets[-1][0] != bucket:
+            self.buckets.append((bucket, {}))
+            while self.buckets[0][0] <= bucket - self.num_buckets:
+                for key, count in self.buckets.popleft()[1].items():
+                    self.totals[key] -= count
+
+        counts = self.buckets[-1][1]
+        keys = [("requests", car_type, start_circle.name),
+                ("arrivals", car_type, destination_circle.name) if served else ("missed", car_type, start_circle.name)]
+        for key in keys:
+            counts[key] = counts.get(key, 0) + 1
+            self.totals[key] = self.totals.get(key, 0) + 1
+
+    def get(self, kind, car_type, circle_name):
+        return self.totals.get((kind, car_type, circle_name), 0)
+
+
+class FleetRebalancer:
+    def __init__(self, rent_it_now: RentItNow, demand_stats=None):
+        self.rent_it_now = rent_it_now
+        self.demand_stats = demand_stats if demand_stats is not None else DemandStats()
+        rent_it_now.demand_stats = self.demand_stats
+
+    def count_available(self, car_type):
+        # Cars with an unknown location are not moved
+        available_by_circle = self.rent_it_now.available_by_circle
+        return {name: available_by_circle.get((car_type, Circle(name)), 0) for name in Circle.NAMES}
+
+    def get_targets(self, car_type, num_cars):
+        requests = {name: self.demand_stats.get("requests", car_type, name) for name in Circle.NAMES}
+        total_requests = sum(requests.values())
+        if not total_requests:
+            return None
+        shares = {name: num_cars * count / total_requests for name, count in requests.items()}
+        targets = {name: int(share) for name, share in shares.items()}
+        # The cars left by the rounding go to the circles with the largest remainders
+        for name in sorted(shares, key=lambda name: shares[name] - targets[name], reverse=True)[:num_cars - sum(targets.values())]:
+            targets[name] += 1
+        return targets
+
+    @staticmethod
+    def solve_transport(supplies, demands, cost):
+        # Minimum cost flow from the supplies to the demands with successive shortest paths; returns {(from, to): units}
+        supplies, demands = dict(supplies), dict(demands)
+        flows = {}
+        while True:
+            distances = {("supply", node): 0 for node, units in supplies.items() if units > 0}
+            if not distances:
+                return flows
+            previous = {}
+            for _ in range(len(supplies) + len(demands)):
+                changed = False
+                for source in supplies:
+                    if ("supply", source) not in distances:
+                        continue
+                    for target in demands:
+                        distance = distances[("supply", source)] + cost(source, target)
+                        if distance < distances.get(("demand", target), float("inf")):
+                            distances[("demand", target)] = distance
+                            previous[("demand", target)] = ("supply", source)
+                            changed = True
+                # A flow can be sent back along the edge it used, at the opposite cost
+                for (source, target), units in flows.items():
+                    if units > 0 and ("demand", target) in distances:
+                        distance = distances[("demand", target)] - cost(source, target)
+                        if distance < distances.get(("supply", source), float("inf")):
+                            distances[("supply", source)] = distance
+                            previous[("supply", source)] = ("demand", target)
+                            changed = True
+                if not changed:
+                    break
+
+            targets = [node for node, units in demands.items() if units > 0 and ("demand", node) in distances]
+            if not targets:
+                return flows
+            end = min(targets, key=lambda node: distances[("demand", node)])
+            path = []
+            node = ("demand", end)
+            while node in previous:
+                path.append((previous[node], node))
+                node = previous[node]
+            origin = node[1]
+
+            amount = min(supplies[origin], demands[end])
+            for start, stop in path:
+                if start[0] == "demand":
+                    amount = min(amount, flows[(stop[1], start[1])])
+            for start, stop in path:
+                if start[0] == "supply":
+                    flows[(start[1], stop[1])] = flows.get((start[1], stop[1]), 0) + amount
+                else:
+                    flows[(stop[1], start[1])] -= amount
+            supplies[origin] -= amount
+            demands[end] -= amount
+
+    def plan(self):
+        # Moves as (car type, from circle, to circle, number of cars)
+        moves = []
+        for car_type in Car.TYPE_PRICES:
+            available = self.count_available(car_type)
+            targets = self.get_targets(car_type, sum(available.values()))
+            if targets is None:
+                continue
+            surplus = {name: available[name] - targets[name] for name in Circle.NAMES if available[name] > targets[name]}
+            deficit = {name: targets[name] - available[name] for name in Circle.NAMES if available[name] < targets[name]}
+            flows = self.solve_transport(surplus, deficit, lambda source, target: RentItNow.get_pickup_distance(Circle(source), Circle(target)))
+            moves.extend((car_type, Circle(source), Circle(target), units) for (source, target), units in flows.items() if units > 0)
+        return moves
+
+    def rebalance(self):
+        moved = distance = 0
+        for car_type, source, target, units in self.plan():
+            for _ in range(units):
+                car = self.rent_it_now.take_car_in_circle(car_type, source)
+                if car is None:
+                    break
+                distance += self.rent_it_now.reposition_car(car, target)
+                moved += 1
+        return {"moved": moved, "distance": distance}
+
+
+def evaluate_rebalancing(create_rent_it_now, demand, rebalance_every=1.0):
+    demand = list(demand)
+    results = {}
+    for rebalance in [False, True]:
+        rent_it_now = create_rent_it_now()
+        simulator = FleetSimulator(rent_it_now)
+        rebalancer = FleetRebalancer(rent_it_now) if rebalance else None
+        next_rebalance = rebalance_every
+        moved = repositioning_distance = 0
+        for request in demand:
+            while rebalancer is not None and request[0] >= next_rebalance:
+                simulator.advance_to(next_rebalance)
+                result = rebalancer.rebalance()
+                moved += result["moved"]
+                repositioning_distance += result["distance"]
+                next_rebalance += rebalance_every
+            simulator.request_trip(*request)
+
+        # The rented hours of get_results stop at current_time, the trips still running are not counted after it
+        fleet_results = simulator.get_results()
+        idle_hours = rent_it_now.current_time * sum(result["cars"] * (1 - result["utilisation"])
+                                                    for result in fleet_results.values())
+        results["rebalanced" if rebalance else "baseline"] = {
+            "waiting_responses": sum(result["missed"] for result in fleet_results.values()),
+            "idle_car_hours": idle_hours,
+            "moved_cars": moved,
+            "repositioning_km": repositioning_distance,
+        }
+    return results
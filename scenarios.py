@@ -0,0 +1,889 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# The scenarios of **RentItNow**: the examples, benchmarks and simulations that use the classes of **rentitnow.py**.
+#
+# Every scenario is a function registered under a name with **scenario**. Its keyword arguments are the parameters of the workload and it returns the results as a dictionary, which **run_scenario** turns into one JSON record with the name, the parameters, the status and the time of the run. A scenario that cannot run here (e.g. without NumPy) raises **ScenarioSkipped**: its status is "skipped", and it's counted apart from the runs that passed or failed.
+#
+# From the command line the scenarios run in parallel worker processes, a new process for every run, and every result is written as one JSON line as soon as it's ready:
+#
+#     python scenarios.py list
+#     python scenarios.py run all --output results.jsonl
+#     python scenarios.py run fleet_simulation --set num_circles=100 --sweep cars_per_type=[1000,2000,4000] --workers 3
+#
+# **--set** gives a value (JSON, or text) to a parameter of the chosen scenarios, **--sweep** a JSON list of values with one run for each value. With **--workers 0** the scenarios run one after the other in the same process. The scenarios that measure time share the CPU cores with the other runs, so their numbers are comparable only when they run alone.
+
+import argparse
+import asyncio
+import contextlib
+import inspect
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from rentitnow import (BenchmarkSuite, Car, Circle, DemandStats, FleetIO, FleetQuery, FleetSimulator, Journal,
+                       MaintenanceScheduler, RentItNow, RentItNowService, ShardedRentItNow, SQLiteRentItNow, User,
+                       evaluate_rebalancing, generate_demand, np)
+
+SCENARIOS = {}  # name -> (function, description)
+
+
+class ScenarioSkipped(Exception):
+    pass
+
+
+def scenario(name, description):
+    def decorator(function):
+        SCENARIOS[name] = (function, description)
+        return function
+    return decorator
+
+
+@contextlib.contextmanager
+def configured_town(**config):
+    # The circles are shared by the whole process, so SimpleTown is set back when the scenario ends
+    Circle.configure(**config)
+    try:
+        yield
+    finally:
+        Circle.configure()
+
+
+def get_car_info(car):
+    return {"license_plate": car.license_plate, "type": car.type, "total_distance": car.total_distance,
+            "next_service_distance": car.next_service_distance, "available": car.availability, "serviced": car.serviced}
+
+
+def get_user_info(user):
+    return {"name": user.name, "surname": user.surname, "address": user.address, "credit_card": user.credit_card,
+            "driving_license": user.driving_license, "selected_car_type": user.selected_car_type,
+            "num_passengers": user.num_passengers}
+
+
+# The cars and users of the first examples
+DEMO_CARS = [
+    ("ECO", "ECO123", "Tesla", "Model S"),
+    ("MID-CLASS", "MID456", "Toyota", "Camry"),
+    ("DELUXE", "DEL789", "Mercedes-Benz", "S-Class"),
+    ("MID-CLASS", "SUV101", "Ford", "Explorer"),
+    ("ECO", "CMP202", "Honda", "Civic"),
+    ("DELUXE", "LUX303", "BMW", "7 Series"),
+]
+
+DEMO_USERS = [
+    ("John", "Doe", "123 Main St", "4123-4567-8901-2345", "DL123456", "ECO", 2, "Inner Circle", "Outer Circle"),
+    ("Jane", "Doe", "456 Elm St", "1234-5678-9012-3456", "DL654321", "MID-CLASS", 4, "Middle Circle", "Outer Circle"),
+    ("Alice", "Smith", "789 Oak St", "9876-5432-1098-7654", "DL987654", "DELUXE", 6, "Inner Circle", "Outer Circle"),
+    ("Emily", "Johnson", "567 Pine St", "5678-9012-3456-7890", "DL135792", "ECO", 1, "Middle Circle", "Middle Circle"),
+    ("Michael", "Williams", "890 Cedar St", "7896-3452-9018-7456", "DL246813", "MID-CLASS", 3, "Inner Circle", "Inner Circle"),
+    ("Sophia", "Brown", "123 Oak St", "3214-8765-9102-6543", "DL975318", "DELUXE", 7, "Middle Circle", "Outer Circle"),
+]
+
+
+def reserve_demo_cars(cars, users, rounds=1, hop_length=5):
+    # From the second round all the cars are returned and the second half of the users asks first
+    with configured_town(hop_length=hop_length):
+        rent_it_now = RentItNow()
+        cars = [Car(*car) for car in cars]
+        for car in cars:
+            rent_it_now.add_car(car)
+        users = [User(*user) for user in users]
+        for user in users:
+            rent_it_now.add_user(user)
+
+        results = []
+        for round_number in range(rounds):
+            if round_number:
+                for car in cars:
+                    car.make_available()
+                half = len(users) // 2
+                users = users[half:] + users[:half]
+            results.append({
+                "reservations": [user.reserve_car(rent_it_now) for user in users],
+                "cars": [get_car_info(car) for car in rent_it_now.iterate_cars()],
+                "bank_account": rent_it_now.get_bank_account(),
+            })
+        return {"rounds": results}
+
+
+# With a hop of 500km (**hop_length=500**) the cars reach 1500km in a few trips, to see the **service** of the cars.
+
+@scenario("more_users_than_cars", "All the cars are rented and some users need to wait")
+def more_users_than_cars(hop_length=5):
+    users = DEMO_USERS[:2] + [DEMO_USERS[2][:7] + ("Outer Circle", "Inner Circle")] + DEMO_USERS[3:5] + \
+        [DEMO_USERS[5][:7] + ("Outer Circle", "Middle Circle")]
+    return reserve_demo_cars(DEMO_CARS[:4], users, hop_length=hop_length)
+
+
+@scenario("more_cars_than_users", "All the users get a car and some cars remain available")
+def more_cars_than_users(hop_length=5):
+    return reserve_demo_cars(DEMO_CARS, DEMO_USERS[:4], hop_length=hop_length)
+
+
+@scenario("same_users_and_cars", "The same number of users and cars, all the cars are rented")
+def same_users_and_cars(hop_length=5, rounds=1):
+    return reserve_demo_cars(DEMO_CARS, DEMO_USERS, rounds, hop_length)
+
+
+@scenario("two_rounds", "The same number of users and cars, for 2 rounds of rental")
+def two_rounds(hop_length=5):
+    return reserve_demo_cars(DEMO_CARS, DEMO_USERS, 2, hop_length)
+
+
+@scenario("car_registry", "Adds, updates and removes cars")
+def car_registry():
+    rent_it_now = RentItNow()
+    for car in DEMO_CARS:
+        rent_it_now.add_car(Car(*car))
+    before = [get_car_info(car) for car in rent_it_now.iterate_cars()]
+
+    rent_it_now.remove_car("SUV101")
+    rent_it_now.update_car(Car("MID-CLASS", "CMP202", "Honda", "Civic"))
+    return {"before": before, "after": [get_car_info(car) for car in rent_it_now.iterate_cars()]}
+
+
+@scenario("user_registry", "Adds, updates and removes users")
+def user_registry():
+    rent_it_now = RentItNow()
+    for user in DEMO_USERS:
+        rent_it_now.add_user(User(*user))
+    before = [get_user_info(user) for user in rent_it_now.iterate_users()]
+
+    rent_it_now.remove_user("DL987654")
+    rent_it_now.update_user(User("Jane", "Doe", "456 Elm St", "3456-9012-5678-1245", "DL654321", "DELUXE", 5, "Middle Circle", "Middle Circle"))
+    return {"before": before, "after": [get_user_info(user) for user in rent_it_now.iterate_users()]}
+
+
+# Thanks to the availability heaps the time per reservation should stay flat when the number of cars grows.
+
+@scenario("reservation_latency", "Time of User.reserve_car for growing fleets")
+def reservation_latency(fleet_sizes=(1_000, 10_000, 100_000), reservations=1000):
+    results = {}
+    for fleet_size in fleet_sizes:
+        rent_it_now = RentItNow()
+        for i in range(fleet_size):
+            rent_it_now.add_car(Car(list(Car.TYPE_PRICES)[i % 3], f"CAR{i}", "Fiat", "Panda"))
+
+        users = [User("Bench", "User", "1 Test St", "0000-0000-0000-0000", f"DL{i}", list(Car.TYPE_PRICES)[i % 3], 1,
+                      "Inner Circle", "Outer Circle") for i in range(reservations)]
+
+        start = time.perf_counter()
+        for user in users:
+            user.reserve_car(rent_it_now)
+        elapsed = time.perf_counter() - start
+
+        results[fleet_size] = {"us_per_reservation": elapsed / reservations * 1e6}
+    return results
+
+
+@scenario("reserve_batch", "Throughput of reserve_batch against a reserve_car loop on the same fleet and requests")
+def reserve_batch(fleet_size=10_000, num_requests=5_000):
+    car_types = list(Car.TYPE_PRICES)
+    circle_names = Circle.NAMES
+
+    def build_fleet():
+        rent_it_now = RentItNow()
+        rent_it_now.add_cars(Car(car_types[i % 3], f"CAR{i}", "Fiat", "Panda") for i in range(fleet_size))
+        return rent_it_now
+
+    users = [User("Bench", "User", "1 Test St", "0000-0000-0000-0000", f"DL{i}", car_types[i % 3], 1,
+                  circle_names[i % 3], circle_names[(i // 3) % 3]) for i in range(num_requests)]
+
+    rent_it_now = build_fleet()
+    start = time.perf_counter()
+    for user in users:
+        user.reserve_car(rent_it_now)
+    loop_elapsed = time.perf_counter() - start
+
+    rent_it_now = build_fleet()
+    requests = [(user, user.selected_car_type, user.num_passengers, user.start_circle, user.destination_circle) for user in users]
+    start = time.perf_counter()
+    rent_it_now.reserve_batch(requests)
+    batch_elapsed = time.perf_counter() - start
+
+    return {"reserve_car_per_second": num_requests / loop_elapsed, "reserve_batch_per_second": num_requests / batch_elapsed}
+
+
+# About two weeks of demand, to see how many requests find no car available. Sweeping **cars_per_type** (e.g. **--sweep cars_per_type=[100,200,400]**) compares the fleet sizes, and with **num_circles** the town is made of that many concentric rings.
+
+@scenario("fleet_simulation", "Requests that find no car available, for a fleet size")
+def fleet_simulation(cars_per_type=200, num_requests=200_000, requests_per_hour=600, num_circles=None, seed=0):
+    names = [f"Ring {i + 1}" for i in range(num_circles)] if num_circles else None
+    with configured_town(names=names):
+        rent_it_now = RentItNow()
+        car_types = list(Car.TYPE_PRICES)
+        rent_it_now.add_cars(Car(car_type, f"{car_type}{i}", "Fiat", "Panda") for car_type in car_types for i in range(cars_per_type))
+
+        start = time.perf_counter()
+        results = FleetSimulator(rent_it_now).run(generate_demand(num_requests, requests_per_hour, seed))
+        return {"seconds": time.perf_counter() - start, "types": results}
+
+
+class DictCar:
+    __init__ = Car.__init__
+
+
+def measure_bytes_per_car(car_class, num_cars):
+    car_types = list(Car.TYPE_PRICES)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    cars = [car_class(car_types[i % 3], f"CAR{i}", "Fiat", "Panda") for i in range(num_cars)]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del cars
+    return used / num_cars
+
+
+@scenario("car_memory", "Bytes used by each car, with __slots__ and with a __dict__ like the objects had before")
+def car_memory(num_cars=(100_000, 1_000_000)):
+    return {count: {"dict_bytes": measure_bytes_per_car(DictCar, count), "slots_bytes": measure_bytes_per_car(Car, count)}
+            for count in num_cars}
+
+
+@scenario("fleet_query", "Status of a large fleet after some reservations, and its CSV report")
+def fleet_query(num_cars=100_000, num_requests=50_000):
+    if np is None:
+        raise ScenarioSkipped("NumPy is not installed")
+
+    rent_it_now = RentItNow()
+    car_types = list(Car.TYPE_PRICES)
+    rent_it_now.add_cars(Car(car_types[i % 3], f"CAR{i}", "Fiat", "Panda") for i in range(num_cars))
+    FleetSimulator(rent_it_now).run(generate_demand(num_requests, requests_per_hour=2000))
+
+    start = time.perf_counter()
+    query = FleetQuery(rent_it_now)
+    report = io.StringIO()
+    query.write_report(report)
+    return {
+        "available_per_type": query.available_count_per_type(),
+        "utilisation_per_type": query.utilisation(),
+        "due_within_100_km": int((query.km_until_service() <= 100).sum()),
+        "top_driven": query.top_driven(3),
+        "report_bytes": len(report.getvalue()),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+@scenario("journal_recovery", "A simulation with the journal, recovered in a new RentItNow as after a restart")
+def journal_recovery(num_cars=300, num_requests=20_000, snapshot_every=20_000):
+    with tempfile.TemporaryDirectory() as directory:
+        journal = Journal(directory, snapshot_every=snapshot_every)
+        rent_it_now = journal.recover()
+        car_types = list(Car.TYPE_PRICES)
+        rent_it_now.add_cars(Car(car_types[i % 3], f"CAR{i}", "Fiat", "Panda") for i in range(num_cars))
+
+        start = time.perf_counter()
+        FleetSimulator(rent_it_now).run(generate_demand(num_requests, requests_per_hour=600))
+        elapsed = time.perf_counter() - start
+        journal.close()
+
+        start = time.perf_counter()
+        recovered_journal = Journal(directory)
+        recovered = recovered_journal.recover()
+        recovery_time = time.perf_counter() - start
+        recovered_journal.close()
+
+        same_cars = [Journal.car_to_record(car) for car in rent_it_now.iterate_cars()] == \
+                    [Journal.car_to_record(car) for car in recovered.iterate_cars()]
+        # The records before the snapshot are read back from the archive of the ledger
+        same_ledger = list(rent_it_now.ledger.iterate_records()) == list(recovered.ledger.iterate_records())
+
+        # A crash in the middle of the last line, then a restart: the records written after it survive the next restart
+        journal_path = os.path.join(directory, Journal.JOURNAL_FILE)
+        torn_journal = Journal(directory)
+        torn_journal.recover().add_car(Car("ECO", "TORN1", "Fiat", "Panda"))
+        torn_journal.close()
+        os.truncate(journal_path, os.path.getsize(journal_path) - 5)
+        torn_journal = Journal(directory)
+        torn_journal.recover().add_car(Car("ECO", "AFTER1", "Fiat", "Panda"))
+        torn_journal.close()
+        reopened_journal = Journal(directory)
+        reopened = reopened_journal.recover()
+        reopened_journal.close()
+        if reopened.get_car("TORN1") is not None or reopened.get_car("AFTER1") is None:
+            raise AssertionError("The records written after a torn journal line were not recovered")
+
+        # Without more records the last group reaches the file within sync_interval
+        quiet_journal = Journal(directory, sync_interval=0.05)
+        quiet = quiet_journal.recover()
+        quiet.add_car(Car("ECO", "QUIET0", "Fiat", "Panda"))  # commits the records of the recovery
+        quiet.add_car(Car("ECO", "QUIET1", "Fiat", "Panda"))
+        time.sleep(0.2)
+        with open(journal_path) as file:
+            durable = '"QUIET1"' in file.read()
+        quiet_journal.close()
+        if not durable:
+            raise AssertionError("The last journal records were not written within sync_interval")
+
+        return {"simulation_seconds": elapsed, "recovery_seconds": recovery_time, "same_cars": same_cars, "same_ledger": same_ledger,
+                "bank_account": rent_it_now.get_bank_account(), "recovered_bank_account": recovered.get_bank_account()}
+
+
+def benchmark_backend(rent_it_now, num_cars=20_000, num_operations=2_000):
+    car_types = list(Car.TYPE_PRICES)
+    timings = {}
+
+    start = time.perf_counter()
+    rent_it_now.add_cars(Car(car_types[i % 3], f"CAR{i}", "Fiat", "Panda") for i in range(num_cars))
+    timings["add_cars"] = time.perf_counter() - start
+
+    users = [User("Bench", "User", "1 Test St", "0000-0000-0000-0000", f"DL{i}", car_types[i % 3], 1,
+                  "Inner Circle", "Outer Circle") for i in range(num_operations)]
+    start = time.perf_counter()
+    for user in users:
+        user.reserve_car(rent_it_now)
+    timings["reserve_car"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(num_operations):
+        rent_it_now.update_car(Car(car_types[(i + 1) % 3], f"CAR{i}", "Fiat", "Tipo"))
+    timings["update_car"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(num_operations):
+        rent_it_now.remove_car(f"CAR{num_cars - 1 - i}")
+    timings["remove_car"] = time.perf_counter() - start
+
+    return timings
+
+
+@scenario("sqlite_backend", "Seconds to add, reserve, update and remove cars in memory and with SQLite")
+def sqlite_backend(num_cars=20_000, num_operations=2_000):
+    memory_timings = benchmark_backend(RentItNow(), num_cars, num_operations)
+    sqlite_rent_it_now = SQLiteRentItNow()
+    try:
+        sqlite_timings = benchmark_backend(sqlite_rent_it_now, num_cars, num_operations)
+    finally:
+        sqlite_rent_it_now.close()
+    return {"memory": memory_timings, "sqlite": sqlite_timings}
+
+
+def reserve_and_return(rent_it_now, car_type, num_reservations, rented_by):
+    thread_id = threading.get_ident()
+    circles = [Circle(name) for name in Circle.NAMES]
+    double_bookings = 0
+    balance = 0
+    for i in range(num_reservations):
+        reservation = rent_it_now.reserve_best_car(car_type, 1, circles[i % 3], circles[(i + 1) % 3])
+        if reservation is None:
+            continue
+        car, travel_time, cost = reservation
+        rent_it_now.update_bank_account(cost, car=car)
+        balance += cost
+        if car.in_service:
+            balance -= MaintenanceScheduler.SERVICE_COST
+        if rented_by.setdefault(car.license_plate, thread_id) != thread_id:
+            double_bookings += 1
+        del rented_by[car.license_plate]
+        car.make_available()
+    return double_bookings, balance
+
+
+def run_reservation_threads(num_threads, num_reservations=5_000, cars_per_type=20):
+    rent_it_now = RentItNow()
+    car_types = list(Car.TYPE_PRICES)
+    rent_it_now.add_cars(Car(car_type, f"{car_type}{i}", "Fiat", "Panda") for car_type in car_types for i in range(cars_per_type))
+    rented_by = {}
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(num_threads) as executor:
+        futures = [executor.submit(reserve_and_return, rent_it_now, car_types[i % 3], num_reservations, rented_by)
+                   for i in range(num_threads)]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+
+    double_bookings = sum(result[0] for result in results)
+    balance = sum(result[1] for result in results)
+    return double_bookings, balance == rent_it_now.get_bank_account(), num_threads * num_reservations / elapsed
+
+
+# The stress test reserves and returns cars from many threads as fast as they can, and checks that every reserved car is not already reserved by another thread and that the bank account matches the payments; the scenario fails if not.
+
+@scenario("reservation_threads", "Stress test of the reservations from many threads, and throughput per number of threads")
+def reservation_threads(thread_counts=(1, 4, 16), num_reservations=5_000):
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads as often as possible to make races likely
+    try:
+        double_bookings, balance_ok, _ = run_reservation_threads(32, num_reservations=2_000, cars_per_type=4)
+    finally:
+        sys.setswitchinterval(switch_interval)
+    if double_bookings:
+        raise AssertionError(f"{double_bookings} cars were reserved by two threads at the same time")
+    if not balance_ok:
+        raise AssertionError("The bank account doesn't match the payments of the threads")
+
+    throughput = {num_threads: run_reservation_threads(num_threads, num_reservations)[2] for num_threads in thread_counts}
+    return {"double_bookings": double_bookings, "bank_account_matches_payments": balance_ok,
+            "reservations_per_second": throughput}
+
+
+async def run_load(host, port, num_clients, requests_per_client):
+    latencies = []
+
+    async def client(client_id):
+        reader, writer = await asyncio.open_connection(host, port)
+
+        async def call(message):
+            writer.write(json.dumps(message).encode() + b"\n")
+            await writer.drain()
+            return json.loads(await reader.readline())
+
+        car_type = list(Car.TYPE_PRICES)[client_id % 3]
+        driving_license = f"LOAD{client_id}"
+        await call({"op": "add_user", "user": {
+            "name": "Load", "surname": str(client_id), "address": "1 Test St", "credit_card": "0000-0000-0000-0000",
+            "driving_license": driving_license, "selected_car_type": car_type, "num_passengers": 1,
+            "start_circle": Circle.NAMES[client_id % 3], "destination_circle": Circle.NAMES[(client_id + 1) % 3]}})
+
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            response = await call({"op": "request_trip", "driving_license": driving_license})
+            latencies.append(time.perf_counter() - start)
+            if response.get("reserved"):
+                await call({"op": "return_car", "license_plate": response["license_plate"]})
+
+        writer.close()
+        await writer.wait_closed()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(client_id) for client_id in range(num_clients)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000,
+    }
+
+
+async def run_service_benchmark(num_clients=500, requests_per_client=40):
+    rent_it_now = RentItNow()
+    car_types = list(Car.TYPE_PRICES)
+    rent_it_now.add_cars(Car(car_type, f"{car_type}{i}", "Fiat", "Panda") for car_type in car_types for i in range(200))
+
+    service = RentItNowService(rent_it_now)
+    port = await service.start()
+    try:
+        return await run_load("127.0.0.1", port, num_clients, requests_per_client)
+    finally:
+        await service.stop()
+
+
+@scenario("service_load", "Starts the service on a local port and runs many concurrent clients against it")
+def service_load(num_clients=500, requests_per_client=40):
+    return asyncio.run(run_service_benchmark(num_clients, requests_per_client))
+
+
+def benchmark_sharded_reservations(num_shards, num_cars=60_000, num_requests=60_000, batch_size=5_000):
+    car_types = list(Car.TYPE_PRICES)
+    rent_it_now = ShardedRentItNow(num_shards)
+    try:
+        rent_it_now.add_cars(Car(car_types[i % 3], f"CAR{i}", "Fiat", "Panda") for i in range(num_cars))
+        users = [User("Bench", "User", "1 Test St", "0000-0000-0000-0000", f"DL{i}", car_types[i % 3], 1,
+                      Circle.NAMES[i % 3], Circle.NAMES[(i // 3) % 3]) for i in range(num_requests)]
+        requests = [(user, user.selected_car_type, user.num_passengers, user.start_circle, user.destination_circle) for user in users]
+
+        start = time.perf_counter()
+        for idx in range(0, num_requests, batch_size):
+            rent_it_now.reserve_batch(requests[idx:idx + batch_size])
+        elapsed = time.perf_counter() - start
+        return num_requests / elapsed, rent_it_now.get_bank_account()
+    finally:
+        rent_it_now.close()
+
+
+# Without **shard_counts** it goes from 1 shard up to one shard per CPU core (at least 3, one per car type). On a machine with a single core the shards share it, so the throughput cannot grow.
+
+@scenario("sharded_reservations", "Reservation throughput of ShardedRentItNow for several numbers of shards")
+def sharded_reservations(shard_counts=None, num_cars=60_000, num_requests=60_000):
+    if shard_counts is None:
+        shard_counts = sorted({1, 2, 3, max(multiprocessing.cpu_count(), 3)})
+    results = {}
+    for num_shards in shard_counts:
+        throughput, bank_account = benchmark_sharded_reservations(num_shards, num_cars, num_requests)
+        results[num_shards] = {"reservations_per_second": throughput, "bank_account": bank_account}
+    return results
+
+
+@scenario("ledger_report", "Revenue of every day, car type and starting circle after a week of demand")
+def ledger_report(cars_per_type=100, num_requests=100_000, requests_per_hour=600):
+    rent_it_now = RentItNow()
+    rent_it_now.add_cars(Car(car_type, f"{car_type}{i}", "Fiat", "Panda") for car_type in Car.TYPE_PRICES for i in range(cars_per_type))
+    FleetSimulator(rent_it_now).run(generate_demand(num_requests, requests_per_hour))
+
+    ledger = rent_it_now.ledger
+    num_days = int(rent_it_now.current_time // 24) + 1
+    return {
+        "records": len(ledger),
+        "balance": ledger.get_balance(),
+        "revenue_per_day": [ledger.revenue_between(day * 24, (day + 1) * 24) for day in range(num_days)],
+        "revenue_per_type": {car_type: ledger.get_total_by_type(car_type) for car_type in Car.TYPE_PRICES},
+        "revenue_per_circle": {circle_name: ledger.get_total_by_circle(circle_name) for circle_name in Circle.NAMES},
+    }
+
+
+# The benchmark runs twice and the second run is compared with the first one. Use **fleet_sizes=[100, 1000, 10000, 100000, 1000000]** to go up to 10^6 cars.
+
+@scenario("benchmark_suite", "The BenchmarkSuite measures, run twice and compared")
+def benchmark_suite(fleet_sizes=(100, 1_000, 10_000), num_operations=2_000, tolerance=0.5):
+    suite = BenchmarkSuite(fleet_sizes=fleet_sizes, num_operations=num_operations)
+    baseline = suite.run()
+    current = suite.run()
+    return {"results": current, "regressions": BenchmarkSuite.compare_results(baseline, current, tolerance)}
+
+
+def benchmark_metrics_overhead(fleet_size=30_000, num_requests=10_000, enabled=False):
+    rent_it_now = RentItNow()
+    rent_it_now.add_cars(BenchmarkSuite.generate_fleet(fleet_size))
+    if enabled:
+        rent_it_now.enable_metrics()
+    users = BenchmarkSuite.generate_users(num_requests)
+
+    start = time.perf_counter()
+    for user in users:
+        user.reserve_car(rent_it_now)
+    return (time.perf_counter() - start) / num_requests, rent_it_now
+
+
+# The metrics are also served on a local port and read back like a scraper would.
+
+@scenario("metrics", "Time of reserve_car with the metrics off and on, and the metrics scraped over HTTP")
+def metrics_overhead(fleet_size=30_000, num_requests=10_000):
+    latency_off, _ = benchmark_metrics_overhead(fleet_size, num_requests, enabled=False)
+    latency_on, rent_it_now = benchmark_metrics_overhead(fleet_size, num_requests, enabled=True)
+
+    metrics = rent_it_now.metrics
+    server = metrics.serve(port=0)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+            text = response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
+    return {
+        "us_per_reservation_metrics_off": latency_off * 1e6,
+        "us_per_reservation_metrics_on": latency_on * 1e6,
+        "reservations": sum(metrics.get_counter("reservations_total", car_type=car_type) for car_type in Car.TYPE_PRICES),
+        "misses": metrics.get_counter("reservation_misses_total", fallback="waiting_time"),
+        "services": sum(metrics.get_counter("services_total", car_type=car_type) for car_type in Car.TYPE_PRICES),
+        "scraped_lines": len(text.splitlines()),
+    }
+
+
+@scenario("class_upgrades", "The same demand with groups of different sizes, without and with the class upgrades")
+def class_upgrades(num_requests=50_000, requests_per_hour=600, fleet=None):
+    fleet = fleet or {"ECO": 60, "MID-CLASS": 100, "DELUXE": 150}
+    rng = random.Random(0)
+    demand = [(request_time, car_type, rng.randint(1, Car.TYPE_CAPACITIES[car_type]), start_circle, destination_circle)
+              for request_time, car_type, _, start_circle, destination_circle in generate_demand(num_requests, requests_per_hour)]
+
+    results = {}
+    for allow_upgrades in [False, True]:
+        rent_it_now = RentItNow(allow_upgrades=allow_upgrades)
+        rent_it_now.add_cars(Car(car_type, f"{car_type}{i}", "Fiat", "Panda") for car_type, num_cars in fleet.items() for i in range(num_cars))
+        type_results = FleetSimulator(rent_it_now).run(demand)
+        results["upgrades" if allow_upgrades else "no_upgrades"] = {
+            "missed": sum(result["missed"] for result in type_results.values()),
+            "bank_account": rent_it_now.get_bank_account(),
+            "types": type_results,
+        }
+    return results
+
+
+@scenario("fleet_io", "Imports a large fleet and users from CSV and JSONL files, and exports them again")
+def import_export(num_cars=1_000_000, num_users=100_000):
+    with tempfile.TemporaryDirectory() as directory:
+        cars_path = os.path.join(directory, "cars.csv")
+        users_path = os.path.join(directory, "users.jsonl")
+        car_types = list(Car.TYPE_PRICES)
+        with open(cars_path, "w", newline="") as file:
+            FleetIO.write_rows(file, FleetIO.CAR_FIELDS, ((car_types[i % 3], f"CAR{i:07d}", "Fiat", "Panda", i % 1500, 1500,
+                                                           Circle.NAMES[i % 3]) for i in range(num_cars)), "csv")
+        with open(users_path, "w") as file:
+            FleetIO.write_rows(file, FleetIO.USER_FIELDS, (("Bench", "User", "1 Test St", "0000-0000-0000-0000", f"DL{i:07d}",
+                                                            car_types[i % 3], 1, Circle.NAMES[i % 3], Circle.NAMES[(i // 3) % 3])
+                                                           for i in range(num_users)), "jsonl")
+
+        fleet_io = FleetIO(RentItNow())
+        start = time.perf_counter()
+        with open(cars_path, newline="") as file:
+            imported_cars = fleet_io.import_cars(file)
+        with open(users_path) as file:
+            imported_users = fleet_io.import_users(file, format="jsonl")
+        import_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with open(os.path.join(directory, "cars.jsonl"), "w") as file:
+            fleet_io.export_cars(file, format="jsonl")
+        with open(os.path.join(directory, "users.csv"), "w", newline="") as file:
+            fleet_io.export_users(file)
+        export_time = time.perf_counter() - start
+
+    try:
+        list(fleet_io.read_cars(io.StringIO("type,license_plate\nECO,A1\nVAN,B2\n")))
+        invalid_file_error = None
+    except ValueError as error:
+        invalid_file_error = str(error)
+    return {"cars": imported_cars, "users": imported_users, "import_seconds": import_time, "export_seconds": export_time,
+            "invalid_file_error": invalid_file_error}
+
+
+def check_fleet_counters(rent_it_now):
+    mismatches = rent_it_now.check_fleet_counters()
+    if mismatches:
+        raise AssertionError(f"The fleet counters don't match the fleet: {mismatches}")
+
+
+@scenario("fleet_counters", "The fleet counters against a full scan, in memory and with SQLite, and the time of fleet_summary")
+def fleet_counters(num_cars=300, num_requests=20_000, large_fleet=100_000):
+    results = {}
+    for rent_it_now in [RentItNow(allow_upgrades=True), SQLiteRentItNow()]:
+        rent_it_now.add_cars(BenchmarkSuite.generate_fleet(num_cars))
+        FleetSimulator(rent_it_now).run(generate_demand(num_requests, requests_per_hour=600))
+        rent_it_now.remove_cars([f"ECO{i:07d}" for i in range(0, num_cars, 7)])
+        rent_it_now.update_car(Car("DELUXE", "DEL0000002", "BMW", "7 Series"))
+        # The same object, changed directly and saved again
+        car = [car for car in rent_it_now.iterate_cars() if car.availability][0]
+        car.total_distance = 700
+        car.availability = False
+        rent_it_now.update_car(car)
+
+        check_fleet_counters(rent_it_now)
+        results[type(rent_it_now).__name__] = rent_it_now.fleet_summary()
+
+    rent_it_now = RentItNow()
+    rent_it_now.add_cars(BenchmarkSuite.generate_fleet(large_fleet))
+    start = time.perf_counter()
+    for _ in range(1000):
+        rent_it_now.fleet_summary()
+    results["fleet_summary_us"] = (time.perf_counter() - start) / 1000 * 1e6
+    start = time.perf_counter()
+    rent_it_now.check_fleet_counters()
+    results["full_scan_ms"] = (time.perf_counter() - start) * 1e3
+    return results
+
+
+# The fleet only picks up users in the circle where the car is (**max_pickup_distance=0**), and most of the trips end in the Inner Circle.
+
+@scenario("rebalancing", "Two days of requests with and without rebalancing the fleet every hour")
+def rebalancing(cars_per_type=90, num_requests=20_000, requests_per_hour=400, destination_weights=(6, 1, 1), rebalance_every=1.0):
+    def create_rent_it_now():
+        rent_it_now = RentItNow(max_pickup_distance=0)
+        rent_it_now.add_cars(Car(car_type, f"{car_type}{i}", "Fiat", "Panda", Circle.NAMES[i % 3])
+                             for car_type in Car.TYPE_PRICES for i in range(cars_per_type))
+        return rent_it_now
+
+    demand = generate_demand(num_requests, requests_per_hour, destination_weights=destination_weights)
+    return evaluate_rebalancing(create_rent_it_now, demand, rebalance_every)
+
+
+# A million quotes from the tables of the **PricingEngine** against **Car.calculate_cost** and **Car.calculate_travel_time**, then a day of requests that mostly start in the Inner Circle with surge pricing updated every hour.
+
+@scenario("surge_pricing", "Time of the quotes, and the revenue of a busy day with and without surge pricing")
+def surge_pricing(num_quotes=1_000_000, cars_per_type=90, num_requests=8_000, requests_per_hour=400, start_weights=(6, 1, 1)):
+    rent_it_now = RentItNow()
+    car = Car("MID-CLASS", "MID1", "Fiat", "Tipo")
+    circles = [Circle(name) for name in Circle.NAMES]
+    trips = [(circles[i % 3], circles[(i // 3) % 3]) for i in range(num_quotes)]
+
+    start = time.perf_counter()
+    for start_circle, destination_circle in trips:
+        distance = start_circle.distance_to(destination_circle)
+        car.calculate_cost(distance), car.calculate_travel_time(distance)
+    calculated = time.perf_counter() - start
+    quote = rent_it_now.pricing.quote
+    start = time.perf_counter()
+    for start_circle, destination_circle in trips:
+        quote("MID-CLASS", start_circle, destination_circle)
+    quoted = time.perf_counter() - start
+    results = {"calculated_seconds": calculated, "quoted_seconds": quoted}
+
+    demand = list(generate_demand(num_requests, requests_per_hour, start_weights=start_weights))
+    for surge in [False, True]:
+        rent_it_now = RentItNow(max_pickup_distance=0)
+        rent_it_now.add_cars(Car(car_type, f"{car_type}{i}", "Fiat", "Panda", Circle.NAMES[i % 3])
+                             for car_type in Car.TYPE_PRICES for i in range(cars_per_type))
+        if surge:
+            rent_it_now.enable_surge_pricing(DemandStats(window_hours=2, bucket_hours=0.25))
+        FleetSimulator(rent_it_now).run(demand, until=24)
+        if surge:
+            results["surge"] = {car_type: {circle.name: rent_it_now.pricing.get_multiplier(car_type, circle) for circle in circles}
+                                for car_type in Car.TYPE_PRICES}
+        results["revenue_with_surge" if surge else "revenue_without_surge"] = rent_it_now.get_bank_account()
+        check_fleet_counters(rent_it_now)
+    return results
+
+
+def benchmark_topology(num_circles, num_lookups=200_000, num_requests=6_000, seed=0):
+    with configured_town(names=[f"Ring {i + 1}" for i in range(num_circles)]):
+        rng = random.Random(seed)
+        circles = [Circle(name) for name in Circle.NAMES]
+        pairs = [(rng.choice(circles), rng.choice(circles)) for _ in range(num_lookups)]
+        start = time.perf_counter()
+        for start_circle, destination_circle in pairs:
+            start_circle.distance_to(destination_circle)
+        lookup_time = (time.perf_counter() - start) / num_lookups
+
+        # As many cars of every type as requests, so no request is left without a car
+        rent_it_now = RentItNow()
+        rent_it_now.add_cars(Car(car_type, f"{car_type}{i}", "Fiat", "Panda", circles[i % num_circles])
+                             for car_type in Car.TYPE_PRICES for i in range(num_requests))
+        car_types = list(Car.TYPE_PRICES)
+        requests = [(rng.choice(car_types), rng.choice(circles), rng.choice(circles)) for _ in range(num_requests)]
+        start = time.perf_counter()
+        for car_type, start_circle, destination_circle in requests:
+            rent_it_now.reserve_best_car(car_type, 1, start_circle, destination_circle)
+        dispatch_time = (time.perf_counter() - start) / num_requests
+        return lookup_time, dispatch_time
+
+
+# The cars are spread over all the rings and the users start in random rings, so some rings run out of cars and the dispatch looks further. The town of four zones has its own hops: three zones one hop away from a central station and three hops away from each other.
+
+@scenario("topology", "Distance lookups and dispatch in towns of many rings, and a town of zones with its own hops")
+def topology(circle_counts=(3, 30, 300), num_requests=6_000):
+    results = {}
+    for num_circles in circle_counts:
+        lookup_time, dispatch_time = benchmark_topology(num_circles, num_requests=num_requests)
+        results[num_circles] = {"distance_to_us": lookup_time * 1e6, "reserve_best_car_us": dispatch_time * 1e6}
+
+    with configured_town(names=["Station", "North", "East", "South"], hop_length=3,
+                         hops=[[1, 2, 2, 2], [2, 1, 3, 3], [2, 3, 1, 3], [2, 3, 3, 1]]):
+        rent_it_now = RentItNow()
+        rent_it_now.add_cars([Car("ECO", "ECO1", "Fiat", "Panda", "North"), Car("ECO", "ECO2", "Fiat", "Panda", "Station")])
+        car, travel_time, cost = rent_it_now.reserve_best_car("ECO", 1, Circle("East"), Circle("South"))
+        results["zones"] = {"license_plate": car.license_plate, "travel_time": travel_time, "cost": cost}
+    return results
+
+
+def run_scenario(name, params):
+    function, _ = SCENARIOS[name]
+    start = time.perf_counter()
+    record = {"scenario": name, "params": params}
+    try:
+        record["results"] = function(**params)
+        record["status"] = "ok"
+    except ScenarioSkipped as reason:
+        record["status"] = "skipped"
+        record["reason"] = str(reason)
+    except Exception as error:
+        record["status"] = "error"
+        record["error"] = f"{type(error).__name__}: {error}"
+    record["seconds"] = time.perf_counter() - start
+    # Decimal amounts are written as strings, so they stay exact
+    return json.loads(json.dumps(record, default=str))
+
+
+def run_scenario_in_pool(run):
+    return run_scenario(*run)
+
+
+def run_in_processes(runs, workers):
+    # A new process for every run, so the circles, the memory and the threads of a scenario don't leak into the next one
+    if sys.version_info >= (3, 11):
+        executor = ProcessPoolExecutor(workers, max_tasks_per_child=1)
+        try:
+            for future in as_completed([executor.submit(run_scenario, name, params) for name, params in runs]):
+                yield future.result()
+        finally:
+            executor.shutdown(cancel_futures=True)
+    else:
+        # max_tasks_per_child is new in Python 3.11, before it only multiprocessing.Pool starts a process per run
+        pool = multiprocessing.Pool(workers, maxtasksperchild=1)
+        try:
+            yield from pool.imap_unordered(run_scenario_in_pool, runs)
+        finally:
+            pool.terminate()
+
+
+def get_params(function):
+    return {name: parameter.default for name, parameter in inspect.signature(function).parameters.items()}
+
+
+def get_runs(names, settings, sweeps):
+    # One run per scenario and combination of the swept values; every scenario gets only the parameters it has
+    runs = []
+    for name in names:
+        params = get_params(SCENARIOS[name][0])
+        fixed = {key: value for key, value in settings.items() if key in params}
+        swept = [(key, values) for key, values in sweeps.items() if key in params]
+        for values in itertools.product(*(values for _, values in swept)):
+            runs.append((name, dict(fixed, **{key: value for (key, _), value in zip(swept, values)})))
+    return runs
+
+
+def parse_assignment(text):
+    # NAME=VALUE, the value is JSON when it can be parsed, otherwise text
+    name, separator, value = text.partition("=")
+    if not separator:
+        raise argparse.ArgumentTypeError(f"Expected NAME=VALUE: {text}")
+    try:
+        return name, json.loads(value)
+    except ValueError:
+        return name, value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs the RentItNow scenarios in parallel worker processes.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list the scenarios with their parameters")
+    run_parser = commands.add_parser("run", help="run scenarios and write their results as JSON lines")
+    run_parser.add_argument("names", nargs="+", help="names of the scenarios, or all")
+    run_parser.add_argument("--set", dest="settings", action="append", default=[], type=parse_assignment, metavar="NAME=VALUE",
+                            help="value of a parameter, for the chosen scenarios that have it")
+    run_parser.add_argument("--sweep", dest="sweeps", action="append", default=[], type=parse_assignment, metavar="NAME=[VALUES]",
+                            help="JSON list of values of a parameter, one run for each value")
+    run_parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes, 0 runs in this process")
+    run_parser.add_argument("--output", help="file for the results, the standard output when missing")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for name, (function, description) in SCENARIOS.items():
+            params = ", ".join(f"{key}={json.dumps(value)}" for key, value in get_params(function).items())
+            print(f"{name}({params})\n    {description}")
+        return 0
+
+    names = list(SCENARIOS) if args.names == ["all"] else args.names
+    for name in names:
+        if name not in SCENARIOS:
+            parser.error(f"Unknown scenario: {name}")
+    settings = dict(args.settings)
+    sweeps = dict(args.sweeps)
+    for key, values in sweeps.items():
+        if not isinstance(values, list):
+            parser.error(f"The values of --sweep {key} must be a JSON list")
+    accepted = set().union(*(get_params(SCENARIOS[name][0]) for name in names))
+    for key in set(settings) | set(sweeps):
+        if key not in accepted:
+            parser.error(f"None of the scenarios has the parameter {key}")
+    runs = get_runs(names, settings, sweeps)
+
+    start = time.perf_counter()
+    failed = skipped = 0
+    with open(args.output, "w") if args.output else contextlib.nullcontext(sys.stdout) as output:
+        if args.workers == 0:
+            records = (run_scenario(name, params) for name, params in runs)
+        else:
+            records = run_in_processes(runs, min(args.workers, len(runs)))
+        with contextlib.closing(records):
+            for record in records:
+                failed += record["status"] == "error"
+                skipped += record["status"] == "skipped"
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+    print(f"{len(runs)} runs, {failed} failed, {skipped} skipped, in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())